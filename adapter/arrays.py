@@ -0,0 +1,189 @@
+# Bulk reads of pointer and array values into NumPy arrays or array.array's.
+# Shared by the classic adapter (adapter/expressions.py) and by adapter2/value.py, so this module must not
+# use package-relative imports.
+import lldb
+import array
+import numbers
+import operator
+from functools import reduce
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Maps the items a pointer points to, or the items of an array, into a NumPy array (or, if NumPy is not
+# available, an array.array), reading them from the debuggee in one go.
+# `shape` is the number of items, or a tuple of dimensions; required for pointers.
+# `dtype` is a NumPy dtype or an array module typecode; by default derived from the item type.
+# `strides` is the distance between consecutive items along each dimension, in items.
+# Without NumPy, only one-dimensional arrays are supported.
+def read_array(sbvalue, shape=None, dtype=None, strides=None):
+    value_type = sbvalue.GetType().GetCanonicalType()
+    type_class = value_type.GetTypeClass()
+    if type_class == lldb.eTypeClassPointer:
+        address = sbvalue.GetValueAsUnsigned()
+        item_type = value_type.GetPointeeType()
+    elif type_class == lldb.eTypeClassArray:
+        address = sbvalue.GetLoadAddress()
+        item_type = value_type.GetArrayElementType()
+    else:
+        raise TypeError('%s is not a pointer or an array' % sbvalue.GetTypeName())
+
+    if dtype is None:
+        basic_type = item_type.GetCanonicalType().GetBasicType()
+        is_num, is_signed, is_float = is_numeric_type(basic_type)
+        if basic_type == lldb.eBasicTypeBool:
+            is_num = True
+        dtype = array_typecode(item_type.GetByteSize(), is_signed, is_float) if is_num else None
+        if dtype is None:
+            raise TypeError('Cannot map %s to an array type, please specify dtype' % item_type.GetName())
+    itemsize = numpy.dtype(dtype).itemsize if numpy is not None else array.array(dtype).itemsize
+
+    if shape is None:
+        if type_class != lldb.eTypeClassArray:
+            raise ValueError('shape is required for pointers')
+        shape = value_type.GetByteSize() // itemsize
+    shape = (shape,) if isinstance(shape, numbers.Integral) else tuple(shape)
+    strides = tuple(strides) if strides is not None else \
+              tuple(reduce(operator.mul, shape[i+1:], 1) for i in range(len(shape)))
+    if numpy is None and len(shape) > 1:
+        raise ValueError('Multi-dimensional arrays require NumPy')
+
+    if len(strides) != len(shape):
+        raise ValueError('strides must have one entry per dimension')
+
+    # Read the span between the lowest and the highest item offsets; strides may be negative or zero.
+    low = high = 0
+    if min(shape) > 0:
+        for dim, stride in zip(shape, strides):
+            if stride < 0:
+                low += (dim - 1) * stride
+            else:
+                high += (dim - 1) * stride
+        count = high - low + 1
+    else:
+        count = 0
+    data = b''
+    if count > 0:
+        error = lldb.SBError()
+        data = sbvalue.GetProcess().ReadMemory(address + low * itemsize, count * itemsize, error)
+        if not error.Success():
+            raise ValueError(error.GetCString())
+
+    if numpy is not None:
+        flat = numpy.frombuffer(data, dtype)
+        return numpy.lib.stride_tricks.as_strided(flat[-low:], shape, [stride * itemsize for stride in strides])
+    else:
+        items = array.array(dtype)
+        if hasattr(items, 'frombytes'):
+            items.frombytes(data)
+        else: # Python 2
+            items.fromstring(data)
+        if count == 0 or strides[0] == 1:
+            return items
+        elif strides[0] == 0:
+            return items * shape[0]
+        else:
+            return items[-low::strides[0]]
+
+# Returns the array module typecode of a numeric type with the given properties, or None.
+def array_typecode(byte_size, is_signed, is_float):
+    codes = 'fd' if is_float else 'bhilq' if is_signed else 'BHILQ'
+    for code in codes:
+        try:
+            if array.array(code).itemsize == byte_size:
+                return code
+        except ValueError: # 'q' and 'Q' are not available in Python 2
+            pass
+    return None
+
+# given an lldb.SBBasicType it returns a tuple (is_numeric, is_signed, is_float)
+def is_numeric_type(basic_type):
+    return type_traits.get(basic_type, (False, False, False))
+type_traits = {
+    lldb.eBasicTypeInvalid: (False, False, False),
+    lldb.eBasicTypeVoid: (False, False, False),
+    lldb.eBasicTypeChar: (True, False, False),
+    lldb.eBasicTypeSignedChar: (True, True, False),
+    lldb.eBasicTypeUnsignedChar: (True, False, False),
+    lldb.eBasicTypeWChar: (True, False, False),
+    lldb.eBasicTypeSignedWChar: (True, True, False),
+    lldb.eBasicTypeUnsignedWChar: (True, False, False),
+    lldb.eBasicTypeChar16: (True, False, False),
+    lldb.eBasicTypeChar32: (True, False, False),
+    lldb.eBasicTypeShort: (True, True, False),
+    lldb.eBasicTypeUnsignedShort: (True, False, False),
+    lldb.eBasicTypeInt: (True, True, False),
+    lldb.eBasicTypeUnsignedInt: (True, False, False),
+    lldb.eBasicTypeLong: (True, True, False),
+    lldb.eBasicTypeUnsignedLong: (True, False, False),
+    lldb.eBasicTypeLongLong: (True, True, False),
+    lldb.eBasicTypeUnsignedLongLong: (True, False, False),
+    lldb.eBasicTypeInt128: (True, True, False),
+    lldb.eBasicTypeUnsignedInt128: (True, False, False),
+    lldb.eBasicTypeBool: (False, False, False),
+    lldb.eBasicTypeHalf: (True, True, True),
+    lldb.eBasicTypeFloat: (True, True, True),
+    lldb.eBasicTypeDouble: (True, True, True),
+    lldb.eBasicTypeLongDouble: (True, True, True),
+    lldb.eBasicTypeFloatComplex: (True, True, False),
+    lldb.eBasicTypeDoubleComplex: (True, True, False),
+    lldb.eBasicTypeLongDoubleComplex: (True, True, False),
+    lldb.eBasicTypeObjCID: (False, False, False),
+    lldb.eBasicTypeObjCClass: (False, False, False),
+    lldb.eBasicTypeObjCSel: (False, False, False),
+    lldb.eBasicTypeNullPtr: (False, False, False),
+}
+
+# --- Tests ---
+
+i32_type = lldb.basic_type('i32', 4, lldb.eBasicTypeInt)
+
+def make_test_array(process, items):
+    import struct
+    return lldb.create_value(process, 'a', i32_type.GetArrayType(len(items)),
+                             struct.pack('<%di' % len(items), *items))
+
+def test_read_array():
+    value = make_test_array(lldb.SBProcess(), range(10))
+    assert list(read_array(value)) == list(range(10))
+    assert list(read_array(value, 5, strides=[2])) == [0, 2, 4, 6, 8]
+    assert list(read_array(value, 0)) == []
+    assert list(read_array(value, 3, strides=[0])) == [0, 0, 0]
+    try:
+        read_array(value, 2, strides=[1, 1])
+        assert False
+    except ValueError:
+        pass
+
+def test_read_array_negative_strides():
+    import struct
+    process = lldb.SBProcess()
+    value = make_test_array(process, range(10))
+    last = value.GetLoadAddress() + 9 * 4
+    pointer = lldb.create_value(process, 'p', i32_type.GetPointerType(), struct.pack('<Q', last))
+    reads = []
+    read_memory = process.ReadMemory
+    def logged_read(address, size, error):
+        reads.append((address, size))
+        return read_memory(address, size, error)
+    process.ReadMemory = logged_read
+    # Reading backwards from the last item only touches the items that are part of the result.
+    assert list(read_array(pointer, 3, strides=[-1])) == [9, 8, 7]
+    assert reads == [(last - 2 * 4, 3 * 4)]
+    assert list(read_array(pointer, 4, strides=[-3])) == [9, 6, 3, 0]
+    if numpy is not None:
+        matrix = read_array(pointer, (2, 3), strides=[-5, -1])
+        assert matrix.tolist() == [[9, 8, 7], [4, 3, 2]]
+
+def test_array_typecode():
+    assert array.array(array_typecode(4, True, False)).itemsize == 4
+    assert array_typecode(8, False, True) == 'd'
+    assert array_typecode(1, False, False) == 'B'
+    assert array_typecode(16, True, False) is None
+
+def run_tests():
+    test_read_array()
+    test_read_array_negative_strides()
+    test_array_typecode()
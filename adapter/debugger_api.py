@@ -2,6 +2,7 @@ import sys
 import lldb
 from . import debugsession
 from . import expressions
+from . import arrays
 
 def evaluate(expr):
     return debugsession.DebugSession.current.evaluate_expr_in_frame(expr, lldb.frame)
@@ -12,6 +13,10 @@ def unwrap(obj):
 def wrap(obj):
     return obj if type(obj) is expressions.Value else expressions.Value(obj)
 
+# Reads items of a pointer or an array value into a NumPy array or an array.array; see arrays.read_array().
+def to_array(value, shape=None, dtype=None, strides=None):
+    return arrays.read_array(unwrap(value), shape, dtype, strides)
+
 def stop_if(cond, handler):
     if cond:
         handler()
@@ -29,4 +34,4 @@ def register_content_provider(provider):
 def register_type_callback(callback, language=None, type_class_mask=lldb.eTypeClassAny):
     expressions.register_type_callback(callback, language, type_class_mask)
 
-__all__ = ['evaluate', 'unwrap', 'wrap', 'stop_if', 'display_html', 'register_type_callback']
+__all__ = ['evaluate', 'unwrap', 'wrap', 'to_array', 'stop_if', 'display_html', 'register_type_callback']
@@ -9,11 +9,18 @@ import re
 import fnmatch
 import json
 import time
+import base64
 import lldb
 from . import expressions
 from . import debugevents
 from . import disassembly
+from . import disasmcache
+from . import fsutil
 from . import handles
+from . import memcache
+from . import memdump
+from . import sourcemap
+from . import stringpages
 from . import terminal
 from . import mem_limit
 from . import PY2, is_string, from_lldb_str, to_lldb_str, xrange
@@ -28,6 +35,20 @@ MAX_VAR_CHILDREN = 10000
 # When None is a valid dictionary entry value, we need some other value to designate missing entries.
 MISSING = ()
 
+# Formatter modules in the 'formatters' directory that are only needed for specific source languages.
+# These are loaded when a compile unit in one of the languages is first seen; all others are loaded before launch.
+LANGUAGE_FORMATTERS = { 'rust': [lldb.eLanguageTypeRust] }
+
+# The number of compile units per shared library inspected when detecting source languages.
+# All compile units of the main executable are inspected.
+MAX_LANGUAGE_PROBE_UNITS = 16
+
+# The number of stack frames of the stopped thread we compute ahead of the client asking for them.
+PREFETCH_FRAMES = 20
+
+# The default number of frames compared when grouping threads by their stacks.
+MAX_UNIQUE_STACK_FRAMES = 256
+
 # Expression types
 SIMPLE = 'simple'
 PYTHON = 'python'
@@ -59,11 +80,23 @@ class DebugSession:
         self.request_seq = 1
         self.pending_requests = {} # { seq : on_complete }
         self.known_threads = set()
+        self.known_thread_ids = [] # known_threads in the order reported by LLDB
+        self.thread_names = {} # { thread_id : display name }, valid till the next stop
+        self.threads = [] # [thread], valid till the next stop; None for threads not yet requested
+        self.unique_stacks = None # Result of DEBUG_uniqueStacks, valid till the next stop
+        self.pause_requested = False
+        self.stack_frames = {} # { thread_id : ThreadStack }, valid till the next stop
+        self.prefetched_variables = {} # { variablesReference : response }, used at most once
+        self.memory_cache = None # memcache.MemoryCache, valid till the next stop; need SBProcess to create
+        self.pending_formatters = {} # { language : [formatter module path] }, not loaded yet
+        self.loaded_formatters = set()
         self.global_format = lldb.eFormatDefault
         self.show_disassembly = 'auto' # never | auto | always
         self.deref_pointers = True
         self.container_summary = True
         self.suppress_missing_sources = self.parameters.get('suppressMissingSourceFiles', True)
+        self.source_map = sourcemap.SourceMap()
+        self.local_paths = fsutil.PathCache(self.resolve_local_path)
         self.evaluation_timeout = self.parameters.get('evaluationTimeout', 5)
 
     def DEBUG_initialize(self, args):
@@ -118,6 +151,9 @@ class DebugSession:
             'supportTerminateDebuggee': True,
             'supportsDelayedStackTraceLoading': True,
             'supportsLogPoints': True,
+            'supportsDisassembleRequest': True,
+            'supportsReadMemoryRequest': True,
+            'supportsWriteMemoryRequest': True,
             'supportsStepBack': self.parameters.get('reverseDebugging', False),
             'exceptionBreakpointFilters': exc_filters,
         }
@@ -129,7 +165,7 @@ class DebugSession:
             return self.custom_launch(args)
         self.exec_commands(args.get('initCommands'))
         self.target = self.create_target(args)
-        self.disassembly = disassembly.AddressSpace(self.target)
+        self.disassembly = self.create_address_space(args)
         self.send_event('initialized', {})
         # defer actual launching till configurationDone request, so that
         # we can receive and set initial breakpoints before the target starts running
@@ -188,7 +224,7 @@ class DebugSession:
             raise UserError('Either \'program\' or \'pid\' is required for attach.')
         self.exec_commands(args.get('initCommands'))
         self.target = self.debugger.CreateTarget('') # A dummy target, will be initialized once we attach
-        self.disassembly = disassembly.AddressSpace(self.target)
+        self.disassembly = self.create_address_space(args)
         self.send_event('initialized', {})
         self.do_launch = self.complete_attach
         self.launch_args = args
@@ -243,7 +279,7 @@ class DebugSession:
         if not self.target.IsValid():
             self.console_err('Warning: target is invalid after running "targetCreateCommands".')
         self.target.GetBroadcaster().AddListener(self.event_listener, lldb.SBTarget.eBroadcastBitBreakpointChanged)
-        self.disassembly = disassembly.AddressSpace(self.target)
+        self.disassembly = self.create_address_space(args)
         self.send_event('initialized', {})
         self.do_launch = self.complete_custom_launch
         self.launch_args = args
@@ -286,23 +322,102 @@ class DebugSession:
         return program
 
     def pre_launch(self):
+        start = time.time()
         formatters = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'formatters')
         for name in os.listdir(formatters):
             file_path = os.path.join(formatters, name)
-            if name.endswith('.py') or os.path.isdir(file_path):
-                self.exec_commands(['command script import \'%s\'' % file_path])
-
+            if name.endswith('.py') or (os.path.isdir(file_path) and name != '__pycache__'):
+                languages = LANGUAGE_FORMATTERS.get(os.path.splitext(name)[0])
+                if languages is None:
+                    self.load_formatters(file_path)
+                else:
+                    for language in languages:
+                        self.pending_formatters.setdefault(language, []).append(file_path)
+        if self.pending_formatters:
+            expressions.language_callback = self.load_language_formatters
+            # Modules of the target created before launch did not generate load events.
+            for i in xrange(self.target.GetNumModules()):
+                self.detect_formatter_languages(self.target.GetModuleAtIndex(i))
+        log.info('Pre-launch formatter setup took %.3fs', time.time() - start)
+
+    def load_formatters(self, file_path):
+        if file_path in self.loaded_formatters:
+            return
+        self.loaded_formatters.add(file_path)
+        start = time.time()
+        self.exec_commands(['command script import \'%s\'' % file_path])
+        log.info('Loaded formatters from %s in %.3fs', file_path, time.time() - start)
+
+    # Returns messages about formatters that went over their budgets: type callbacks, and loaded formatter modules
+    # that provide pop_budget_reports().
+    def pop_budget_reports(self):
+        reports = expressions.pop_budget_reports()
+        for file_path in self.loaded_formatters:
+            module = sys.modules.get(os.path.splitext(os.path.basename(file_path))[0])
+            if module is not None and hasattr(module, 'pop_budget_reports'):
+                reports.extend(module.pop_budget_reports())
+        return reports
+
+    def load_language_formatters(self, language):
+        for file_path in self.pending_formatters.pop(language, []):
+            self.load_formatters(file_path)
+
+    # Loads pending formatters for languages of the module's compile units.
+    # Only the first few compile units of shared libraries are inspected, but all of those of the main executable,
+    # whose leading units often come from C runtime objects.  If none of them reports a language (e.g. with PDB
+    # debug info, which does not record Rust as the source language), all pending formatters are loaded.
+    # Languages missed here are picked up from the stopped thread's frames; see detect_frame_languages.
+    def detect_formatter_languages(self, module):
+        num_units = module.GetNumCompileUnits()
+        if num_units == 0:
+            return
+        if module.GetFileSpec().fullpath != self.target.GetExecutable().fullpath:
+            num_units = min(num_units, MAX_LANGUAGE_PROBE_UNITS)
+        language_known = False
+        for i in xrange(num_units):
+            language = module.GetCompileUnitAtIndex(i).GetLanguage()
+            if language in self.pending_formatters:
+                self.load_language_formatters(language)
+                return
+            if language != lldb.eLanguageTypeUnknown:
+                language_known = True
+        if not language_known or (module.GetSymbolFileSpec().GetFilename() or '').lower().endswith('.pdb'):
+            for language in list(self.pending_formatters):
+                self.load_language_formatters(language)
+
+    # Loads pending formatters for languages of the compile units on the thread's stack.
+    def detect_frame_languages(self, thread):
+        for i in xrange(min(thread.GetNumFrames(), PREFETCH_FRAMES)):
+            language = thread.GetFrameAtIndex(i).GetCompileUnit().GetLanguage()
+            if language in self.pending_formatters:
+                self.load_language_formatters(language)
+                if not self.pending_formatters:
+                    return
+
+    # Prefix mappings are applied by LLDB (target.source-map), so paths we get from it are already translated.
+    # The adapter's SourceMap only handles what LLDB can't: suppressed prefixes (mapped to None), which are matched
+    # in their translated form as well, and search roots.
     def init_source_map(self, args):
         source_map = args.get('sourceMap')
+        suppressed = sourcemap.translate_suppressed(source_map or {})
+        self.source_map = sourcemap.SourceMap(suppressed, args.get('sourceSearchRoots'))
+        self.local_paths.clear()
         if source_map is None:
             return
         value = []
         for remote_prefix, local_prefix in source_map.items():
+            if local_prefix is None:
+                continue
             value.append(remote_prefix)
             value.append(local_prefix)
         value = '"' + '" "'.join([v.replace('\\', '\\\\').replace('"', '\\"') for v in value]) + '"'
         lldb.SBDebugger.SetInternalVariable('target.source-map', to_lldb_str(value), self.debugger.GetInstanceName())
 
+    def create_address_space(self, args):
+        cache_dir = args.get('disassemblyCacheDir')
+        cache = disasmcache.DisassemblyCache(cache_dir, self.target) if cache_dir else None
+        return disassembly.AddressSpace(self.target, cache=cache)
+
     def exec_commands(self, commands):
         if commands is not None:
             interp = self.debugger.GetCommandInterpreter()
@@ -737,6 +852,7 @@ class DebugSession:
         error = self.process.Stop()
         if error.Fail():
             raise UserError(error.GetCString())
+        self.pause_requested = True
 
     def DEBUG_continue(self, args):
         self.before_resume()
@@ -792,64 +908,124 @@ class DebugSession:
                 self.console_err(result.GetError())
                 return
 
+    # In addition to the standard DAP semantics, supports paging via optional 'startThread' and 'threadCount'
+    # arguments, in which case the response also contains 'totalThreads'.
     def DEBUG_threads(self, args):
-        threads = []
-        for thread in self.process:
-            index = thread.GetIndexID()
-            tid = thread.GetThreadID()
-            display = '%d: tid=%d' % (index, tid)
+        num_threads = self.process.GetNumThreads()
+        start_thread = args.get('startThread', 0)
+        end_thread = min(start_thread + args.get('threadCount', num_threads), num_threads)
+        threads = self.threads
+        if len(threads) < end_thread:
+            threads.extend([None] * (end_thread - len(threads)))
+        for i in range(start_thread, end_thread):
+            if threads[i] is None:
+                thread = self.process.GetThreadAtIndex(i)
+                tid = thread.GetThreadID()
+                threads[i] = { 'id': tid, 'name': self.get_thread_name(thread, tid) }
+        response = { 'threads': threads[start_thread:end_thread] }
+        if 'startThread' in args or 'threadCount' in args:
+            response['totalThreads'] = num_threads
+        return response
+
+    # Thread names are cached till the next stop, since the debuggee may rename threads while running.
+    def get_thread_name(self, thread, tid):
+        display = self.thread_names.get(tid)
+        if display is None:
+            display = '%d: tid=%d' % (thread.GetIndexID(), tid)
             name = thread.GetName()
             if name is not None:
                 display += ' "%s"' % name
-            threads.append({ 'id': tid, 'name': display })
-        return { 'threads': threads }
+            self.thread_names[tid] = display
+        return display
 
     def DEBUG_stackTrace(self, args):
-        thread = self.process.GetThreadByID(args['threadId'])
+        thread_id = args['threadId']
+        stack = self.get_thread_stack(thread_id)
         start_frame = args.get('startFrame', 0)
-        levels = args.get('levels', sys.maxsize)
-        if start_frame + levels > thread.num_frames:
-            levels = thread.num_frames - start_frame
-        stack_frames = []
-        for i in range(start_frame, start_frame + levels):
-            frame = thread.frames[i]
-            stack_frame = { 'id': self.var_refs.create(frame, (thread.GetThreadID(), i), None) }
-            fn_name = frame.GetFunctionName()
-            if fn_name is None:
-                fn_name = str(frame.GetPCAddress())
-            stack_frame['name'] = fn_name
-
-            if not self.in_disassembly(frame):
-                le = frame.GetLineEntry()
-                fs = le.GetFileSpec()
-                local_path = self.map_filespec_to_local(fs)
-                if local_path is not None:
-                    stack_frame['source'] = {
-                        'name': fs.GetFilename(),
-                        'path': local_path,
-                        'origin': frame.GetModule().GetFileSpec().GetFilename()
-                    }
-                    stack_frame['line'] = le.GetLine()
-                    stack_frame['column'] = le.GetColumn()
-            else:
-                pc_addr = frame.GetPCAddress()
-                dasm = self.disassembly.get_by_address(pc_addr)
-                if not dasm:
-                    dasm = self.disassembly.create_from_address(pc_addr)
-                if dasm:
-                    stack_frame['source'] = {
-                        'name': dasm.source_name,
-                        'sourceReference': dasm.source_ref,
-                        'origin': frame.GetModule().GetFileSpec().GetFilename()
-                    }
-                    stack_frame['line'] = dasm.line_num_by_address(pc_addr.GetLoadAddress(self.target))
-                    stack_frame['column'] = 0
-
-            if not frame.GetLineEntry().IsValid():
-                stack_frame['presentationHint'] = 'subtle' # No line debug info.
+        end_frame = min(start_frame + args.get('levels', sys.maxsize), stack.total_frames)
+        stack_frames = stack.frames
+        if len(stack_frames) < end_frame:
+            stack_frames.extend([None] * (end_frame - len(stack_frames)))
+        # Only unwind the frames we haven't seen during this stop.
+        for i in range(start_frame, end_frame):
+            if stack_frames[i] is None:
+                stack_frames[i] = self.make_stack_frame(stack.thread, thread_id, i)
+        return { 'stackFrames': stack_frames[start_frame:end_frame], 'totalFrames': stack.total_frames }
+
+    # Groups threads by their call stacks, like `pstack | uniq` does.
+    # Stacks are compared by the sequence of PCs of their frames (up to 'maxFrames' of them);
+    # frames of each distinct stack are taken from the first thread that has it.
+    # Returns { 'stacks': [{ 'threadIds': [...], 'count': n, 'stackFrames': [...], 'totalFrames': n }] },
+    # sorted by the number of threads, in descending order.
+    def DEBUG_uniqueStacks(self, args):
+        max_frames = args.get('maxFrames', MAX_UNIQUE_STACK_FRAMES)
+        if self.unique_stacks is None or self.unique_stacks[0] != max_frames:
+            threads_by_stack = collections.OrderedDict() # { (pc, ...) : [thread_id] }
+            for thread in self.process:
+                num_frames = min(thread.GetNumFrames(), max_frames)
+                get_frame = thread.GetFrameAtIndex
+                stack_key = tuple(get_frame(i).GetPC() for i in xrange(num_frames))
+                threads_by_stack.setdefault(stack_key, []).append(thread.GetThreadID())
+            stacks = []
+            for thread_ids in threads_by_stack.values():
+                stack = self.DEBUG_stackTrace({ 'threadId': thread_ids[0], 'levels': max_frames })
+                stack['threadIds'] = thread_ids
+                stack['count'] = len(thread_ids)
+                stacks.append(stack)
+            stacks.sort(key=lambda stack: stack['count'], reverse=True)
+            self.unique_stacks = (max_frames, stacks)
+        return { 'stacks': self.unique_stacks[1] }
+
+    # Returns the per-stop unwinding state of a thread.
+    def get_thread_stack(self, thread_id):
+        stack = self.stack_frames.get(thread_id)
+        if stack is None:
+            stack = ThreadStack(self.process.GetThreadByID(thread_id))
+            self.stack_frames[thread_id] = stack
+        return stack
+
+    def make_stack_frame(self, thread, thread_id, index):
+        frame = thread.GetFrameAtIndex(index)
+        stack_frame = { 'id': self.var_refs.create(frame, (thread_id, index), None),
+                        'instructionPointerReference': '0x%X' % frame.GetPC() }
+        fn_name = frame.GetFunctionName()
+        if fn_name is None:
+            fn_name = str(frame.GetPCAddress())
+        stack_frame['name'] = fn_name
+
+        le = frame.GetLineEntry()
+        if self.show_disassembly == 'always':
+            local_path = None
+        else:
+            fs = le.GetFileSpec()
+            local_path = self.map_filespec_to_local(fs)
+
+        if local_path is not None or self.show_disassembly == 'never':
+            if local_path is not None:
+                stack_frame['source'] = {
+                    'name': fs.GetFilename(),
+                    'path': local_path,
+                    'origin': frame.GetModule().GetFileSpec().GetFilename()
+                }
+                stack_frame['line'] = le.GetLine()
+                stack_frame['column'] = le.GetColumn()
+        else:
+            pc_addr = frame.GetPCAddress()
+            dasm = self.disassembly.get_by_address(pc_addr)
+            if not dasm:
+                dasm = self.disassembly.create_from_address(pc_addr)
+            if dasm:
+                stack_frame['source'] = {
+                    'name': dasm.source_name,
+                    'sourceReference': dasm.source_ref,
+                    'origin': frame.GetModule().GetFileSpec().GetFilename()
+                }
+                stack_frame['line'] = dasm.line_num_by_address(pc_addr.GetLoadAddress(self.target))
+                stack_frame['column'] = 0
 
-            stack_frames.append(stack_frame)
-        return { 'stackFrames': stack_frames, 'totalFrames': len(thread) }
+        if not le.IsValid():
+            stack_frame['presentationHint'] = 'subtle' # No line debug info.
+        return stack_frame
 
     # Should we show source or disassembly for this frame?
     def in_disassembly(self, frame):
@@ -868,6 +1044,47 @@ class DebugSession:
             raise UserError('Source is not available.')
         return { 'content': dasm.get_source_text(), 'mimeType': 'text/x-lldb.disassembly' }
 
+    def DEBUG_disassemble(self, args):
+        address = int(args['memoryReference'], 0) + args.get('offset', 0)
+        resolve_symbols = args.get('resolveSymbols', False)
+        instructions = []
+        prev_source = None
+        pages = self.disassembly.iter_instruction_page(address, args.get('instructionOffset', 0),
+                                                       args['instructionCount'])
+        for dasm, start, end in pages:
+            if dasm is None: # No code there
+                for i in range(end):
+                    instructions.append({ 'address': '0x%X' % (start + i), 'instruction': '??' })
+                prev_source = None
+                continue
+            for instr, addr, hex_bytes, num_bytes in dasm.iter_instructions(start, end, disassembly.MAX_INSTR_LENGTH):
+                text = '%-6s %s' % (instr.GetMnemonic(self.target), instr.GetOperands(self.target))
+                comment = instr.GetComment(self.target)
+                if len(comment) > 0:
+                    text += '  ; ' + comment
+                instruction = {
+                    'address': '0x%X' % addr,
+                    'instructionBytes': disassembly.format_hex_bytes(hex_bytes),
+                    'instruction': text
+                }
+                sbaddr = instr.GetAddress()
+                if resolve_symbols:
+                    symbol = sbaddr.GetSymbol()
+                    if symbol.IsValid():
+                        instruction['symbol'] = symbol.GetName()
+                le = sbaddr.GetLineEntry()
+                if le.IsValid():
+                    local_path = self.map_filespec_to_local(le.GetFileSpec())
+                    if local_path is not None:
+                        # Source may be omitted if it's the same as that of the previous instruction.
+                        if local_path != prev_source:
+                            instruction['location'] = { 'name': os.path.basename(local_path), 'path': local_path }
+                            prev_source = local_path
+                        instruction['line'] = le.GetLine()
+                        instruction['column'] = le.GetColumn()
+                instructions.append(instruction)
+        return { 'instructions': instructions }
+
     def DEBUG_scopes(self, args):
         frame_id = args['frameId']
         frame = self.var_refs.get(frame_id)
@@ -887,6 +1104,10 @@ class DebugSession:
 
     def DEBUG_variables(self, args):
         container_handle = args['variablesReference']
+        prefetched = self.prefetched_variables.pop(container_handle, None)
+        if prefetched is not None:
+            return prefetched
+
         container_info = self.var_refs.get_vpath(container_handle)
         if container_info is None:
             log.error('Invalid variables reference: %d', container_handle)
@@ -957,6 +1178,9 @@ class DebugSession:
                 'variablesReference': handle,
                 'evaluateName': evalName
             }
+            memory_reference = self.get_memory_reference(var)
+            if memory_reference is not None:
+                variable['memoryReference'] = memory_reference
             # Ensure proper variable shadowing: if variable of the same name had already been added,
             # remove it and insert the new instance at the end.
             if name in variables:
@@ -967,6 +1191,9 @@ class DebugSession:
                 self.console_err('Child list expansion has timed out.')
                 break
 
+        for message in self.pop_budget_reports():
+            self.console_err(message)
+
         variables = list(variables.values())
 
         # If this node was synthetic (i.e. a product of a visualizer),
@@ -1060,7 +1287,58 @@ class DebugSession:
         else:
             return self.launch_args.get('expressions', SIMPLE), expr
 
-    def evaluate_expr(self, args, expr):
+    # Evaluates a list of expressions in one frame: { expressions, frameId, context }.
+    # Returns { results: [evaluate response body, or { error: message } if evaluation failed] }.
+    def DEBUG_evaluateBatch(self, args):
+        if self.process is None:
+            log.error('evaluateBatch without a process')
+            return { 'results': [{ 'result': '' } for expr in args['expressions']] }
+        if args.get('context') not in ['watch', 'hover']:
+            args['context'] = 'watch'
+        results = [None] * len(args['expressions'])
+        def on_result(index, result):
+            if isinstance(result, Exception):
+                if not isinstance(result, UserError):
+                    log.error('Internal debugger error:\n%s', traceback.format_exc())
+                result = { 'error': str(result) }
+            results[index] = result
+        self.evaluate_batch(args, args['expressions'], on_result)
+        return { 'results': results }
+
+    # Evaluates expressions in the frame given by args, sharing one variable lookup context among them.
+    # Calls on_result(index, response body or exception) for each expression; exceptions are passed
+    # from within the handler, so that the traceback is still available.
+    def evaluate_batch(self, args, exprs, on_result):
+        frame = self.var_refs.get(args.get('frameId'), None)
+        if frame is None:
+            frame = self.process.GetSelectedThread().GetSelectedFrame()
+        frame_vars = expressions.PyEvalContext(frame)
+        for index, expr in enumerate(exprs):
+            try:
+                result = self.evaluate_expr(args, expr, frame_vars)
+            except Exception as e:
+                on_result(index, e)
+            else:
+                on_result(index, result)
+
+    # Evaluates 'watch' requests for the same frame, which were queued right behind `message`, together with it.
+    def handle_watch_requests(self, message):
+        frame_id = message['arguments'].get('frameId')
+        def is_same_watch(target, args):
+            message = args[0]
+            return target == self.handle_message and message is not None and is_watch_request(message) and \
+                   message['arguments'].get('frameId') == frame_id
+        messages = [message] + [args[0] for target, args in self.event_loop.take_queued(is_same_watch)]
+        log.info('### Handling %d watch evaluations', len(messages))
+        def on_result(index, result):
+            message = messages[index]
+            response = { 'type': 'response', 'command': 'evaluate',
+                         'request_seq': message['seq'], 'success': False }
+            self.send_response(response, result)
+        exprs = [message['arguments']['expression'] for message in messages]
+        self.evaluate_batch(message['arguments'], exprs, on_result)
+
+    def evaluate_expr(self, args, expr, frame_vars=None):
         frame_id = args.get('frameId') # May be null
         # parse format suffix, if any
         format = self.global_format
@@ -1078,7 +1356,7 @@ class DebugSession:
             sys.stderr = None
         try:
            frame = self.var_refs.get(frame_id, None)
-           result = self.evaluate_expr_in_frame(expr, frame)
+           result = self.evaluate_expr_in_frame(expr, frame, frame_vars)
         finally:
             sys.stderr = saved_stderr
 
@@ -1096,7 +1374,11 @@ class DebugSession:
             dtype = result.GetTypeName();
             handle = self.get_var_handle(result, expr, None)
             value = self.get_var_value_str(result, format, handle != 0)
-            return { 'result': value, 'type': dtype, 'variablesReference': handle }
+            response = { 'result': value, 'type': dtype, 'variablesReference': handle }
+            memory_reference = self.get_memory_reference(result)
+            if memory_reference is not None:
+                response['memoryReference'] = memory_reference
+            return response
         else: # Some Python value
             return { 'result': str(result), 'variablesReference': 0 }
 
@@ -1104,8 +1386,9 @@ class DebugSession:
     pyeval_globals = { 'exit':None, 'quit':None, 'globals':None }
 
     # Evaluates expr in the context of frame (or in global context if frame is None)
+    # frame_vars is an expressions.PyEvalContext for the frame, which may be shared by several evaluations.
     # Returns expressions.Value or SBValue on success, SBError on failure.
-    def evaluate_expr_in_frame(self, expr, frame):
+    def evaluate_expr_in_frame(self, expr, frame, frame_vars=None):
         ty, expr = self.get_expression_type(expr)
         if ty == NATIVE:
             if frame is not None:
@@ -1120,18 +1403,20 @@ class DebugSession:
         else:
             if frame is None: # Use the currently selected frame
                 frame = self.process.GetSelectedThread().GetSelectedFrame()
+            if frame_vars is None:
+                frame_vars = expressions.PyEvalContext(frame)
 
             if ty == PYTHON:
                 expr = expressions.preprocess_python_expr(expr)
                 self.set_selected_frame(frame)
                 eval_globals = self.session_dict
-                eval_globals['__frame_vars'] = expressions.PyEvalContext(frame)
+                eval_globals['__frame_vars'] = frame_vars
                 eval_locals = {}
             else: # SIMPLE
                 expr = expressions.preprocess_simple_expr(expr)
                 log.info('Preprocessed expr: %s', expr)
                 eval_globals = self.pyeval_globals
-                eval_locals = expressions.PyEvalContext(frame)
+                eval_locals = frame_vars
                 eval_globals['__frame_vars'] = eval_locals
 
             try:
@@ -1248,6 +1533,20 @@ class DebugSession:
     # Clears out cached state that become invalid once debuggee resumes.
     def before_resume(self):
         self.var_refs.reset()
+        self.pause_requested = False
+        self.clear_stop_caches()
+
+    # Clears out responses computed for the current stop.
+    def clear_stop_caches(self):
+        del self.threads[:]
+        self.thread_names.clear()
+        self.stack_frames.clear()
+        self.unique_stacks = None
+        self.prefetched_variables.clear()
+        if self.memory_cache is not None:
+            self.memory_cache.clear()
+        expressions.reset_type_callback_budgets()
+        expressions.clear_frame_vars_cache()
 
     def DEBUG_setVariable(self, args):
         container = self.var_refs.get(args['variablesReference'])
@@ -1270,9 +1569,110 @@ class DebugSession:
         error = lldb.SBError()
         if not var.SetValueFromCString(to_lldb_str(args['value']), error):
             raise UserError(error.GetCString())
+        self.prefetched_variables.clear()
         return { 'value': self.get_var_value_str(var, self.global_format, False) }
 
+    # Reads a page of a string value: { variablesReference, offset, count }.
+    # Strings are either values with synthetic children representing their bytes (e.g. Rust strings),
+    # or pointers to, or arrays of single-byte characters, which are treated as NUL-terminated.
+    def DEBUG_readString(self, args):
+        var = self.var_refs.get(args['variablesReference'])
+        if not isinstance(var, lldb.SBValue):
+            raise UserError('Invalid variable reference.')
+        address, length = self.get_string_location(var)
+        return stringpages.read_string_page(self.process, address, length,
+                                            args.get('offset', 0), args.get('count', stringpages.MAX_PAGE_SIZE))
+
+    # Returns (address, length) of string data; length is None for NUL-terminated strings.
+    def get_string_location(self, var):
+        value_type = var.GetType()
+        type_class = value_type.GetTypeClass()
+        if type_class in [lldb.eTypeClassPointer, lldb.eTypeClassArray]:
+            item_type = value_type.GetPointeeType() if type_class == lldb.eTypeClassPointer else \
+                        value_type.GetArrayElementType()
+            if item_type.GetByteSize() == 1 and item_type.GetCanonicalType().GetBasicType() in \
+                    [lldb.eBasicTypeChar, lldb.eBasicTypeSignedChar, lldb.eBasicTypeUnsignedChar]:
+                address = var.GetValueAsUnsigned() if type_class == lldb.eTypeClassPointer else var.GetLoadAddress()
+                return address, None
+        elif var.IsSynthetic() and var.GetNumChildren() > 0:
+            # Synthetic providers of string-like types expose bytes as children.
+            first = var.GetChildAtIndex(0)
+            if first.GetByteSize() == 1 and first.GetLoadAddress() != lldb.LLDB_INVALID_ADDRESS:
+                return first.GetLoadAddress(), var.GetNumChildren()
+        raise UserError('%s is not a string.' % var.GetTypeName())
+
+    # Returns the memory reference of a value: address of the pointee for pointers, otherwise address of the value.
+    def get_memory_reference(self, var):
+        if var.GetType().GetTypeClass() == lldb.eTypeClassPointer:
+            address = var.GetValueAsUnsigned()
+        else:
+            address = var.GetLoadAddress()
+        if address in [0, lldb.LLDB_INVALID_ADDRESS]:
+            return None
+        return '0x%X' % address
+
+    def get_memory_cache(self):
+        if self.memory_cache is None:
+            self.memory_cache = memcache.MemoryCache(memcache.process_reader(self.process))
+        return self.memory_cache
+
+    # Memory is read through the page cache, in chunks of up to memcache.MAX_CHUNK bytes.
+    def DEBUG_readMemory(self, args):
+        address = int(args['memoryReference'], 0) + args.get('offset', 0)
+        count = args['count']
+        if address < 0:
+            raise UserError('Invalid memory address.')
+        data, unreadable = self.get_memory_cache().read(address, count)
+        return {
+            'address': '0x%X' % address,
+            'data': base64.b64encode(data).decode('ascii'),
+            'unreadableBytes': unreadable
+        }
+
+    def DEBUG_writeMemory(self, args):
+        address = int(args['memoryReference'], 0) + args.get('offset', 0)
+        data = base64.b64decode(args['data'])
+        error = lldb.SBError()
+        written = self.process.WriteMemory(address, data, error)
+        self.get_memory_cache().invalidate(address, len(data))
+        self.prefetched_variables.clear()
+        if not error.Success():
+            raise UserError(error.GetCString())
+        return { 'bytesWritten': written }
+
+    # Dumps debuggee memory to a local file: { path, memoryReference, count } or { path, variablesReference[, count] }.
+    # For pointers, the pointee is dumped; `count` defaults to the size of the pointee type.
+    def DEBUG_dumpMemory(self, args):
+        if 'variablesReference' in args:
+            var = self.var_refs.get(args['variablesReference'])
+            if not isinstance(var, lldb.SBValue):
+                raise UserError('Invalid variable reference.')
+            memory_reference = self.get_memory_reference(var)
+            if memory_reference is None:
+                raise UserError('%s is not in memory.' % var.GetName())
+            value_type = var.GetType()
+            if value_type.GetTypeClass() == lldb.eTypeClassPointer:
+                value_type = value_type.GetPointeeType()
+            count = args.get('count', value_type.GetByteSize())
+        else:
+            memory_reference = args['memoryReference']
+            count = args['count']
+        address = int(memory_reference, 0) + args.get('offset', 0)
+        path = os.path.abspath(os.path.expanduser(args['path']))
+        def progress(done, total):
+            self.console_msg('Dumping memory: %d%% done' % (done * 100 // total))
+        with open(path, 'wb') as file:
+            stats = memdump.dump_memory(memcache.process_reader(self.process), address, count, file,
+                                        progress=progress)
+        message = '%s from 0x%X to %s' % (stats, address, path)
+        log.info('%s', message)
+        self.console_msg(message)
+        return { 'bytesWritten': stats.size, 'unreadableBytes': stats.unreadable, 'elapsed': stats.elapsed }
+
     def DEBUG_disconnect(self, args):
+        self.local_paths.log_stats()
+        if self.disassembly is not None and self.disassembly.cache is not None:
+            self.disassembly.cache.log_stats()
         if self.launch_args is not None:
             self.exec_commands(self.launch_args.get('exitCommands'))
         if self.process:
@@ -1283,6 +1683,7 @@ class DebugSession:
                 self.process.Detach()
         self.restart = args.get('restart', False)
         self.process = None
+        self.memory_cache = None
         self.target = None
         self.terminal = None
         self.listener_handler_token = None
@@ -1324,6 +1725,7 @@ class DebugSession:
 
     # Fake a target stop to force VSCode to refresh the display
     def refresh_client_display(self):
+        self.clear_stop_caches() # Cached responses were formatted using the old settings
         thread_id = self.process.GetSelectedThread().GetThreadID()
         self.send_event('continued', { 'threadId': thread_id,
                                        'allThreadsContinued': True })
@@ -1349,6 +1751,8 @@ class DebugSession:
                 on_complete(True, message.get('body'))
             else:
                 on_complete(False, message.get('message'))
+        elif self.process is not None and is_watch_request(message):
+            self.handle_watch_requests(message)
         else: # request
             command =  message['command']
             args = message.get('arguments', {})
@@ -1423,6 +1827,7 @@ class DebugSession:
         if ev_type == lldb.SBProcess.eBroadcastBitStateChanged:
             state = lldb.SBProcess.GetStateFromEvent(event)
             if state == lldb.eStateRunning:
+                self.clear_stop_caches()
                 self.send_event('continued', { 'threadId': 0, 'allThreadsContinued': True })
             elif state == lldb.eStateStopped:
                 if not lldb.SBProcess.GetRestartedFromEvent(event):
@@ -1441,6 +1846,7 @@ class DebugSession:
             self.notify_stdio(ev_type)
 
     def notify_target_stopped(self, lldb_event):
+        self.clear_stop_caches()
         self.update_threads()
         event = { 'allThreadsStopped': True } # LLDB always stops all threads
         # Find the thread that caused this stop
@@ -1453,8 +1859,11 @@ class DebugSession:
             if stop_reason != lldb.eStopReasonInvalid and stop_reason != lldb.eStopReasonNone:
                 stopped_thread = selected_thread
 
-        # Fall back to scanning all threads in the process
-        if stopped_thread is None:
+        # Fall back to scanning all threads in the process, unless we've requested this stop ourselves,
+        # in which case no thread is likely to have a stop reason.
+        pause_requested = self.pause_requested
+        self.pause_requested = False
+        if stopped_thread is None and not pause_requested:
             for thread in self.process:
                 stop_reason = thread.GetStopReason()
                 if stop_reason != lldb.eStopReasonInvalid and stop_reason != lldb.eStopReasonNone:
@@ -1494,14 +1903,39 @@ class DebugSession:
 
             event['reason'] = stop_reason_str
             event['threadId'] = stopped_thread.GetThreadID()
+        elif pause_requested and selected_thread.IsValid():
+            stopped_thread = selected_thread
+            event['reason'] = 'pause'
+            event['threadId'] = stopped_thread.GetThreadID()
 
         self.send_event('stopped', event)
 
+        if stopped_thread is not None:
+            if self.pending_formatters:
+                self.detect_frame_languages(stopped_thread)
+            self.prefetch_stop_info(stopped_thread)
+
+    # Upon receiving 'stopped', VSCode will request the stack trace of the stopped thread, then
+    # scopes and locals of the top frame, waiting for each response before sending the next request.
+    # We compute these while the 'stopped' event is in flight, so they can be served from cache.
+    def prefetch_stop_info(self, thread):
+        try:
+            stack = self.DEBUG_stackTrace({ 'threadId': thread.GetThreadID(), 'levels': PREFETCH_FRAMES })
+            stack_frames = stack['stackFrames']
+            if len(stack_frames) == 0:
+                return
+            scopes = self.DEBUG_scopes({ 'frameId': stack_frames[0]['id'] })
+            locals_handle = scopes['scopes'][0]['variablesReference']
+            self.prefetched_variables[locals_handle] = self.DEBUG_variables({ 'variablesReference': locals_handle })
+        except Exception:
+            log.error('Could not prefetch stop info: %s', traceback.format_exc())
+
     # Notify VSCode about target threads that started or exited since the last stop.
     def update_threads(self):
-        threads = set()
-        for thread in self.process:
-            threads.add(thread.GetThreadID())
+        thread_ids = [thread.GetThreadID() for thread in self.process]
+        if thread_ids == self.known_thread_ids: # The common case: nothing has changed.
+            return
+        threads = set(thread_ids)
         started = threads - self.known_threads
         exited = self.known_threads - threads
         for thread_id in exited:
@@ -1509,6 +1943,7 @@ class DebugSession:
         for thread_id in started:
             self.send_event('thread', { 'threadId': thread_id, 'reason': 'started' })
         self.known_threads = threads
+        self.known_thread_ids = thread_ids
 
     def notify_stdio(self, ev_type):
         if ev_type == lldb.SBProcess.eBroadcastBitSTDOUT:
@@ -1542,7 +1977,7 @@ class DebugSession:
         le = addr.GetLineEntry()
         if le:
             bp_info = BreakpointInfo(bp_id, SOURCE)
-            bp_info.file_path = le.GetFileSpec().fullpath
+            bp_info.file_path = self.map_path_to_local(le.GetFileSpec().fullpath)
             bp_info.line = le.GetLine()
         else:
             bp_info = BreakpointInfo(bp_id, ASSEMBLY)
@@ -1573,6 +2008,8 @@ class DebugSession:
                 if mod.GetSymbolFileSpec().IsValid():
                     message += ' Symbols loaded.'
                 self.console_msg(message)
+                if self.pending_formatters:
+                    self.detect_formatter_languages(mod)
 
     def handle_debugger_output(self, output):
         self.send_event('output', { 'category': 'stdout', 'output': output })
@@ -1597,15 +2034,31 @@ class DebugSession:
     def console_err(self, output):
         self.console_msg(output, 'stderr')
 
+    # Translates a path reported by LLDB into a local path, without checking that the file exists.
+    def map_path_to_local(self, path):
+        if not self.source_map.is_empty():
+            local_path = self.source_map.resolve(path)
+            if local_path is not None:
+                return os.path.normpath(local_path)
+        return path
+
     # Translates SBFileSpec into a local path using mappings in source_map.
     # Returns None if source info should be suppressed.  There are 3 cases when this happens:
     # - filespec.IsValid() is false,
     # - user has directed us to suppress source info by setting the local prefix is source map to None,
     # - suppress_missing_sources is true and the local file does not exist.
+    # Results are cached, because this is called for every frame of every stack trace.
     def map_filespec_to_local(self, filespec):
         if not filespec.IsValid():
             return None
-        local_path = os.path.normpath(filespec.fullpath)
+        return self.local_paths.get(filespec.fullpath)
+
+    def resolve_local_path(self, path):
+        if not self.source_map.is_empty():
+            path = self.source_map.resolve(path)
+            if path is None:
+                return None
+        local_path = os.path.normpath(path)
         if self.suppress_missing_sources and not os.path.isfile(local_path):
             local_path = None
         return local_path
@@ -1644,6 +2097,14 @@ class RegistersScope:
     def __init__(self, frame):
         self.frame = frame
 
+# Stack frames of a thread, unwound incrementally as the client pages through them.
+class ThreadStack:
+    __slots__ = ['thread', 'frames', 'total_frames']
+    def __init__(self, thread):
+        self.thread = thread
+        self.frames = []        # Stack frame dicts, None for frames not yet requested.
+        self.total_frames = thread.GetNumFrames()
+
 # Various info we mantain about a breakpoint
 class BreakpointInfo:
     __slots__ = ['id', 'kind', 'condition', 'ignore_count', 'log_message',
@@ -1676,6 +2137,11 @@ def SBValueChildrenIter(val):
 def opt_lldb_str(s):
     return to_lldb_str(s) if s != None else None
 
+# Whether message is an 'evaluate' request in 'watch' context.
+def is_watch_request(message):
+    return message['type'] == 'request' and message['command'] == 'evaluate' and \
+           message.get('arguments', {}).get('context') == 'watch'
+
 def compose_eval_name(container, var_name):
     if container is None:
         return expressions.escape_variable_name(var_name)
@@ -1684,3 +2150,142 @@ def compose_eval_name(container, var_name):
     else:
         return container + '.' + expressions.escape_variable_name(var_name)
 
+
+# --- Tests ---
+
+def make_test_session(event_loop, sent):
+    session = DebugSession({}, event_loop, sent.append)
+    session.process = object()
+    def evaluate_expr(args, expr, frame_vars=None):
+        if expr.startswith('bad'):
+            raise UserError('cannot evaluate ' + expr, no_console=True)
+        return { 'result': expr.upper(), 'variablesReference': 0 }
+    session.evaluate_expr = evaluate_expr
+    return session
+
+def test_evaluate_batch():
+    from .eventloop import EventLoop
+    session = make_test_session(EventLoop(), [])
+    frame_id = session.var_refs.create(object(), '[0]', None)
+    result = session.DEBUG_evaluateBatch({ 'expressions': ['a', 'bad1', 'b'], 'frameId': frame_id })
+    assert result['results'] == [{ 'result': 'A', 'variablesReference': 0 },
+                                 { 'error': 'cannot evaluate bad1' },
+                                 { 'result': 'B', 'variablesReference': 0 }]
+
+def test_coalesce_watch_requests():
+    from .eventloop import EventLoop
+    event_loop = EventLoop()
+    sent = []
+    session = make_test_session(event_loop, sent)
+    dispatch = event_loop.make_dispatcher(session.handle_message)
+    frame1 = session.var_refs.create(object(), '[0]', None)
+    frame2 = session.var_refs.create(object(), '[1]', None)
+    def watch(seq, expr, frame_id):
+        return { 'type': 'request', 'seq': seq, 'command': 'evaluate',
+                 'arguments': { 'expression': expr, 'frameId': frame_id, 'context': 'watch' } }
+    first = watch(1, 'a', frame1)
+    for message in [watch(2, 'bad2', frame1), watch(3, 'c', frame1), watch(4, 'd', frame2), watch(5, 'e', frame1)]:
+        dispatch(message)
+    session.handle_message(first)
+    # Requests for the same frame queued right behind the first one are answered together, in order.
+    assert [(r['request_seq'], r['success']) for r in sent] == [(1, True), (2, False), (3, True)]
+    assert sent[0]['body']['result'] == 'A' and sent[2]['body']['result'] == 'C'
+    assert sent[1]['body']['error']['format'] == 'cannot evaluate bad2'
+    # The rest stay queued.
+    assert [args[0]['seq'] for target, args in event_loop.queue] == [4, 5]
+
+class TestObject:
+    def __init__(self, **attrs):
+        self.__dict__.update(attrs)
+
+def make_test_module(path, languages, symbol_file=None):
+    units = [TestObject(GetLanguage=lambda language=language: language) for language in languages]
+    return TestObject(GetFileSpec=lambda: TestObject(fullpath=path),
+                      GetSymbolFileSpec=lambda: TestObject(GetFilename=lambda: symbol_file),
+                      GetNumCompileUnits=lambda: len(units),
+                      GetCompileUnitAtIndex=lambda i: units[i])
+
+def test_detect_formatter_languages():
+    from .eventloop import EventLoop
+    session = make_test_session(EventLoop(), [])
+    session.target = TestObject(GetExecutable=lambda: TestObject(fullpath='/bin/main'))
+    loaded = []
+    session.load_formatters = loaded.append
+    def reset():
+        del loaded[:]
+        session.pending_formatters = { lldb.eLanguageTypeRust: ['rust.py'] }
+    c_units = [lldb.eLanguageTypeC99] * (MAX_LANGUAGE_PROBE_UNITS + 1)
+    # Rust units behind many C units are only found in the main executable.
+    reset()
+    session.detect_formatter_languages(make_test_module('/lib/libfoo.so', c_units + [lldb.eLanguageTypeRust]))
+    assert loaded == []
+    session.detect_formatter_languages(make_test_module('/bin/main', c_units + [lldb.eLanguageTypeRust]))
+    assert loaded == ['rust.py'] and session.pending_formatters == {}
+    # Unknown languages: load everything.
+    reset()
+    session.detect_formatter_languages(make_test_module('/lib/libfoo.so', [lldb.eLanguageTypeUnknown]))
+    assert loaded == ['rust.py']
+    reset()
+    session.detect_formatter_languages(make_test_module('/bin/main.exe', [lldb.eLanguageTypeC99], 'main.pdb'))
+    assert loaded == ['rust.py']
+    # Missed at load time, found on the stack at a stop.
+    reset()
+    frames = [TestObject(GetCompileUnit=lambda language=language: TestObject(GetLanguage=lambda: language))
+              for language in [lldb.eLanguageTypeC99, lldb.eLanguageTypeRust]]
+    thread = TestObject(GetNumFrames=lambda: len(frames), GetFrameAtIndex=lambda i: frames[i])
+    session.detect_frame_languages(thread)
+    assert loaded == ['rust.py']
+
+def test_stop_state_reset():
+    from .eventloop import EventLoop
+    session = make_test_session(EventLoop(), [])
+    names = ['worker']
+    thread = TestObject(GetIndexID=lambda: 2, GetName=lambda: names[0])
+    assert session.get_thread_name(thread, 100) == '2: tid=100 "worker"'
+    names[0] = 'renamed'
+    assert session.get_thread_name(thread, 100) == '2: tid=100 "worker"' # Cached during a stop
+    session.pause_requested = True
+    session.before_resume()
+    assert not session.pause_requested
+    assert session.get_thread_name(thread, 100) == '2: tid=100 "renamed"'
+
+def make_test_threads(stacks):
+    threads = []
+    for thread_id, pcs in enumerate(stacks):
+        frames = [TestObject(GetPC=lambda pc=pc: pc) for pc in pcs]
+        threads.append(TestObject(GetThreadID=lambda thread_id=thread_id: thread_id,
+                                  GetNumFrames=lambda frames=frames: len(frames),
+                                  GetFrameAtIndex=lambda i, frames=frames: frames[i]))
+    return threads
+
+def test_unique_stacks():
+    from .eventloop import EventLoop
+    session = make_test_session(EventLoop(), [])
+    idle = [0x10, 0x20, 0x30]
+    busy = [0x40, 0x20, 0x30]
+    session.process = make_test_threads([idle, busy, idle, idle, busy, [0x50]])
+    requested = []
+    def stack_trace(args):
+        requested.append(args['threadId'])
+        return { 'stackFrames': [], 'totalFrames': 0 }
+    session.DEBUG_stackTrace = stack_trace
+    stacks = session.DEBUG_uniqueStacks({})['stacks']
+    assert [(stack['threadIds'], stack['count']) for stack in stacks] == [([0, 2, 3], 3), ([1, 4], 2), ([5], 1)]
+    assert requested == [0, 1, 5] # Frames come from the first thread with each stack.
+    # The result is cached till the next stop.
+    session.process = make_test_threads([idle, [0x10, 0x99]])
+    stacks = session.DEBUG_uniqueStacks({})['stacks']
+    assert [stack['threadIds'] for stack in stacks] == [[0, 2, 3], [1, 4], [5]]
+    session.clear_stop_caches()
+    stacks = session.DEBUG_uniqueStacks({})['stacks']
+    assert [stack['threadIds'] for stack in stacks] == [[0], [1]]
+    # Stacks that only differ below maxFrames are grouped together.
+    stacks = session.DEBUG_uniqueStacks({ 'maxFrames': 1 })['stacks']
+    assert [stack['threadIds'] for stack in stacks] == [[0, 1]]
+
+def run_tests():
+    test_evaluate_batch()
+    test_coalesce_watch_requests()
+    test_detect_formatter_languages()
+    test_stop_state_reset()
+    test_unique_stacks()
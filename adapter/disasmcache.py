@@ -0,0 +1,181 @@
+import os
+import json
+import logging
+import tempfile
+import lldb
+
+log = logging.getLogger('disasmcache')
+
+FORMAT_VERSION = 2
+
+# Load layout of a module: the range of file addresses it occupies and the offset ("slide")
+# between its file and load addresses.
+class ModuleLayout:
+    def __init__(self, file_start, file_end, slide):
+        self.file_start = file_start
+        self.file_end = file_end
+        self.slide = slide
+
+    @staticmethod
+    def from_module(module, target):
+        file_start = file_end = slide = None
+        for i in range(module.GetNumSections()):
+            section = module.GetSectionAtIndex(i)
+            file_addr = section.GetFileAddress()
+            load_addr = section.GetLoadAddress(target)
+            size = section.GetByteSize()
+            if size == 0 or file_addr == lldb.LLDB_INVALID_ADDRESS or load_addr == lldb.LLDB_INVALID_ADDRESS:
+                continue
+            if slide is None:
+                slide = load_addr - file_addr
+                file_start = file_addr
+                file_end = file_addr + size
+            elif load_addr - file_addr != slide:
+                return None # Sections were relocated independently, can't relocate with a single offset.
+            else:
+                file_start = min(file_start, file_addr)
+                file_end = max(file_end, file_addr + size)
+        if slide is None:
+            return None
+        return ModuleLayout(file_start, file_end, slide)
+
+# Persistent cache of rendered disassembly, keyed by (module UUID, file address range, module slide), so that
+# code in modules that do not change between debug sessions (system libraries, large static binaries)
+# does not need to be disassembled again.
+# Rendered text contains load addresses (branch targets, comments), which cannot be reliably told apart from
+# other numbers in the operands, so entries are only valid for the load address they were created at.
+# Since LLDB disables ASLR by default, modules usually get loaded at the same address from session to session.
+class DisassemblyCache(object):
+    def __init__(self, cache_dir, target):
+        self.cache_dir = cache_dir
+        self.target = target
+        self.lldb_version = lldb.SBDebugger.GetVersionString()
+        self.layouts = {} # { module UUID : ModuleLayout or None }
+        self.hits = 0
+        self.misses = 0
+
+    # Returns cache key for the code in [start_sbaddr, end_sbaddr), or None if it cannot be cached.
+    def get_key(self, start_sbaddr, end_sbaddr):
+        module = start_sbaddr.GetModule()
+        if not module.IsValid():
+            return None
+        uuid = module.GetUUIDString()
+        if not uuid:
+            return None
+        layout = self.layouts.get(uuid, ())
+        if layout == ():
+            layout = self.layouts[uuid] = ModuleLayout.from_module(module, self.target)
+        if layout is None:
+            return None
+        file_start = start_sbaddr.GetFileAddress()
+        file_end = end_sbaddr.GetFileAddress()
+        if not (layout.file_start <= file_start < file_end <= layout.file_end):
+            return None
+        return (uuid, file_start, file_end, layout.slide)
+
+    def get_path(self, key):
+        uuid, file_start, file_end, slide = key
+        return os.path.join(self.cache_dir, uuid, '%x-%x@%x.json' % (file_start, file_end, slide))
+
+    # Returns (load addresses, rendered lines) of the instructions, or None if not cached.
+    def load(self, key):
+        data = self.read_entry(key)
+        if data is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return data['addresses'], data['lines']
+
+    # Returns contents of the cache entry, or None if it does not exist or was written by a different
+    # version of the cache or of LLDB, or for a different key.
+    def read_entry(self, key):
+        try:
+            with open(self.get_path(key), 'r') as f:
+                data = json.load(f)
+        except (IOError, OSError, ValueError):
+            return None
+        if data.get('version') != FORMAT_VERSION or data.get('lldb') != self.lldb_version or \
+                data.get('key') != list(key):
+            return None
+        return data
+
+    # Stores rendered instruction lines; stale entries are overwritten.
+    def store(self, key, addresses, lines):
+        if self.read_entry(key) is not None:
+            return
+        path = self.get_path(key)
+        data = {
+            'version': FORMAT_VERSION,
+            'lldb': self.lldb_version,
+            'key': list(key),
+            'addresses': addresses,
+            'lines': lines
+        }
+        try:
+            dir = os.path.dirname(path)
+            if not os.path.isdir(dir):
+                os.makedirs(dir)
+            # Write to a temporary file first, so that concurrent sessions never see partial data.
+            fd, temp_path = tempfile.mkstemp(dir=dir)
+            with os.fdopen(fd, 'w') as f:
+                json.dump(data, f)
+            try:
+                os.rename(temp_path, path)
+            except OSError: # On Windows, rename fails if the destination exists.
+                try:
+                    os.remove(path)
+                    os.rename(temp_path, path)
+                except OSError:
+                    os.remove(temp_path)
+                    raise
+        except (IOError, OSError) as e:
+            log.warning('Could not write %s: %s', path, e)
+
+    def log_stats(self):
+        log.info('Disassembly cache: %d hits, %d misses', self.hits, self.misses)
+
+# --- Tests ---
+
+def make_test_cache(cache_dir):
+    cache = DisassemblyCache.__new__(DisassemblyCache)
+    cache.cache_dir = cache_dir
+    cache.lldb_version = 'test'
+    cache.hits = cache.misses = 0
+    cache.layouts = {}
+    return cache
+
+def test_store_load():
+    import shutil
+    cache_dir = tempfile.mkdtemp()
+    try:
+        cache = make_test_cache(cache_dir)
+        key = ('UUID', 0x1100, 0x1108, 0x10000)
+        lines = ['00011100: 55    push   rbp', '00011104: 48 81 EC    sub    rsp, 0x1000']
+        assert cache.load(key) is None
+        cache.store(key, [0x11100, 0x11104], lines)
+        assert cache.load(key) == ([0x11100, 0x11104], lines)
+        # The same code loaded at a different address is a different entry.
+        assert cache.load(('UUID', 0x1100, 0x1108, 0x20000)) is None
+        assert cache.hits == 1 and cache.misses == 2
+    finally:
+        shutil.rmtree(cache_dir)
+
+def test_overwrite_stale():
+    import shutil
+    cache_dir = tempfile.mkdtemp()
+    try:
+        key = ('UUID', 0x1100, 0x1104, 0)
+        old_cache = make_test_cache(cache_dir)
+        old_cache.lldb_version = 'old'
+        old_cache.store(key, [0x1100], ['00001100: 55    push   rbp'])
+        cache = make_test_cache(cache_dir)
+        assert cache.load(key) is None
+        cache.store(key, [0x1100], ['00001100: 55    push   rbp'])
+        assert cache.load(key) is not None
+        assert os.listdir(os.path.join(cache_dir, 'UUID')) == [os.path.basename(cache.get_path(key))]
+    finally:
+        shutil.rmtree(cache_dir)
+
+def run_tests():
+    test_store_load()
+    test_overwrite_stale()
@@ -1,93 +1,278 @@
 import logging
+import bisect
+import binascii
+import collections
 import lldb
 from . import handles
 
 log = logging.getLogger('disassembly')
 
 MAX_INSTR_BYTES = 8 # Max number of instruction bytes to show.
+MAX_INSTR_LENGTH = 16 # Max length of an instruction on any architecture we support.
 NO_SYMBOL_INSTRUCTIONS = 32 # How many instructions to show when there isn't a symbol associated
                             # with the PC location.
+RENDER_CHUNK = 4096 # Instructions are rendered in chunks of this size, to bound the size of memory reads.
+MAX_CACHED_BYTES = 64 * 1024**2 # Approximate memory budget for disassembled instructions.
+SYMBOL_PAGE_BYTES = 64 * 1024 # Symbols larger than this are disassembled in pages of about this size.
+INSTRUCTION_COST = 320 # Approximate memory cost of one disassembled instruction
+                       # (SBInstruction, line address and a line of rendered text).
 
-# bisect_left with get_key
-def lower_bound(a, x, get_key = lambda x: x):
-    lo = 0
-    hi = len(a)
-    while lo < hi:
-        mid = (lo+hi)//2
-        if get_key(a[mid]) < x: lo = mid+1
-        else: hi = mid
-    return lo
-
-# bisect_right with get_key
-def upper_bound(a, x, get_key = lambda x: x):
-    lo = 0
-    hi = len(a)
-    while lo < hi:
-        mid = (lo+hi)//2
-        if x < get_key(a[mid]): hi = mid
-        else: lo = mid+1
-    return lo
+# An index of objects with `start_address` and `end_address` attributes, whose ranges may overlap.
+# The address space is kept partitioned into disjoint segments, each mapped to the item with the highest start
+# address among those covering it, so lookups are a single `bisect`.  Inserting an item splits at most two
+# segments, which shifts the tails of `bounds` and `owners` (O(n), though done by a single memmove), and then
+# updates each segment the item covers.
+class IntervalIndex:
+    def __init__(self):
+        self.bounds = [] # Sorted segment start addresses
+        self.owners = [] # owners[i] is the item covering [bounds[i], bounds[i+1]), or None
+        self.count = 0
 
+    def __len__(self):
+        return self.count
+
+    def insert(self, item):
+        start, end = item.start_address, item.end_address
+        self.count += 1
+        if start >= end:
+            return
+        i = self.split(start)
+        j = self.split(end)
+        owners = self.owners
+        for k in range(i, j):
+            owner = owners[k]
+            if owner is None or owner.start_address <= start:
+                owners[k] = item
+
+    # Makes sure a segment starts at `address` and returns its index.
+    def split(self, address):
+        bounds = self.bounds
+        i = bisect.bisect_left(bounds, address)
+        if i == len(bounds) or bounds[i] != address:
+            bounds.insert(i, address)
+            self.owners.insert(i, self.owners[i-1] if i > 0 else None)
+        return i
+
+    # Returns the item with the highest start address among those containing `address`.
+    def find(self, address):
+        i = bisect.bisect_right(self.bounds, address) - 1
+        return self.owners[i] if i >= 0 else None
+
+def read_instructions(target, start_sbaddr, end_address):
+    error = lldb.SBError()
+    length = end_address - start_sbaddr.GetLoadAddress(target)
+    instr_bytes = target.ReadMemory(start_sbaddr, length, error)
+    return target.GetInstructions(start_sbaddr, instr_bytes)
+
+# DisassembledRange's are never forgotten, because VSCode may refer to them by source reference at any time,
+# however their instructions are kept only for the most recently used ones, up to max_bytes worth.
+# The rest are re-disassembled on demand.
 class AddressSpace:
-    def __init__(self, target):
+    def __init__(self, target, max_bytes=MAX_CACHED_BYTES, cache=None):
         self.target = target
+        self.cache = cache # disasmcache.DisassemblyCache, optional
         self.by_handle = handles.Handles()
-        self.by_address = [] # A list of DisassembledRange's sorted by start_address
+        self.by_address = IntervalIndex() # DisassembledRange's indexed by address range
+        self.loaded = collections.OrderedDict() # { source_ref : DisassembledRange } in LRU order
+        self.loaded_bytes = 0
+        self.max_bytes = max_bytes
 
     def create_from_address(self, addr):
         symbol = addr.GetSymbol()
         if symbol.IsValid():
             start_addr = symbol.GetStartAddress()
             end_addr = symbol.GetEndAddress()
+            if end_addr.GetLoadAddress(self.target) - start_addr.GetLoadAddress(self.target) > SYMBOL_PAGE_BYTES:
+                return self.create_symbol_page(addr.GetLoadAddress(self.target), start_addr, end_addr)
+            cache_key = self.get_cache_key(start_addr, end_addr)
+            dasm = self.create_from_cache(cache_key, start_addr, end_addr)
+            if dasm is not None:
+                return dasm
             instructions = symbol.GetInstructions(self.target)
         else:
+            cache_key = None # The extent of symbol-less ranges depends on where disassembly has started.
             start_addr = addr
-            instructions = self.target.ReadInstructions(start_addr, NO_SYMBOL_INSTRUCTIONS + 1)
+            instructions = self.target.ReadInstructions(start_addr, NO_SYMBOL_INSTRUCTIONS)
             if len(instructions) == 0:
                 return None
+            # The range ends right after the last instruction, so that reloading it yields the same instructions.
             last_instr = instructions[len(instructions)-1] # SBInstructionList doesn't support negative indices!
-            end_addr = last_instr.GetAddress()
+            end_addr = lldb.SBAddress(last_instr.GetAddress().GetLoadAddress(self.target) + last_instr.GetByteSize(),
+                                      self.target)
         dasm = DisassembledRange(self.target, start_addr, end_addr, instructions)
-        self.insert(dasm)
-        return dasm
+        return self.add(dasm, cache_key)
+
+    # Returns the page of a large symbol containing `address`.
+    # Instruction boundaries are only known when disassembling forward from the symbol start, so pages are
+    # created in sequence from there, each starting where the previous one ends.
+    def create_symbol_page(self, address, symbol_start, symbol_end):
+        target = self.target
+        page_start = symbol_start.GetLoadAddress(target)
+        symbol_end = symbol_end.GetLoadAddress(target)
+        while True:
+            dasm = self.by_address.find(page_start)
+            if dasm is None or dasm.start_address != page_start:
+                dasm = self.create_page(page_start, symbol_end)
+                if dasm is None:
+                    return None
+            if address < dasm.end_address or dasm.end_address >= symbol_end:
+                return self.use(dasm)
+            page_start = dasm.end_address
+
+    # Disassembles about SYMBOL_PAGE_BYTES starting at `page_start`, ending on an instruction boundary.
+    def create_page(self, page_start, symbol_end):
+        target = self.target
+        page_limit = min(symbol_end, page_start + SYMBOL_PAGE_BYTES)
+        start_addr = lldb.SBAddress(page_start, target)
+        # Read past the limit, so that the instruction straddling it is decoded whole.
+        instructions = read_instructions(target, start_addr, min(symbol_end, page_limit + MAX_INSTR_LENGTH))
+        page = lldb.SBInstructionList()
+        page_end = page_start
+        for instr in instructions:
+            instr_address = instr.GetAddress().GetLoadAddress(target)
+            if instr_address >= page_limit:
+                break
+            page.AppendInstruction(instr)
+            page_end = instr_address + instr.GetByteSize()
+        if page_end <= page_start:
+            return None
+        end_addr = lldb.SBAddress(page_end, target)
+        cache_key = self.get_cache_key(start_addr, end_addr)
+        dasm = self.create_from_cache(cache_key, start_addr, end_addr)
+        if dasm is not None:
+            return dasm
+        dasm = DisassembledRange(target, start_addr, end_addr, page)
+        return self.add(dasm, cache_key)
 
     def create_from_range(self, start_addr, end_addr):
-        error = lldb.SBError()
-        length = end_addr.GetLoadAddress(self.target) - start_addr.GetLoadAddress(self.target)
-        instr_bytes = self.target.ReadMemory(start_addr, length, error)
-        instructions = self.target.GetInstructions(start_addr, instr_bytes)
+        cache_key = self.get_cache_key(start_addr, end_addr)
+        dasm = self.create_from_cache(cache_key, start_addr, end_addr)
+        if dasm is not None:
+            return dasm
+        instructions = read_instructions(self.target, start_addr, end_addr.GetLoadAddress(self.target))
         dasm = DisassembledRange(self.target, start_addr, end_addr, instructions)
+        return self.add(dasm, cache_key)
+
+    def get_cache_key(self, start_addr, end_addr):
+        return self.cache.get_key(start_addr, end_addr) if self.cache is not None else None
+
+    def create_from_cache(self, cache_key, start_addr, end_addr):
+        if cache_key is None:
+            return None
+        cached = self.cache.load(cache_key)
+        if cached is None:
+            return None
+        dasm = DisassembledRange(self.target, start_addr, end_addr, None)
+        dasm.set_cached_lines(*cached)
+        return self.add(dasm, cache_key)
+
+    def add(self, dasm, cache_key):
+        if cache_key is not None:
+            dasm.cache = self.cache
+            dasm.cache_key = cache_key
         self.insert(dasm)
-        return dasm
+        return self.use(dasm)
 
     def get_by_handle(self, h):
-        return self.by_handle.get(h)
+        dasm = self.by_handle.get(h)
+        return self.use(dasm) if dasm is not None else None
 
-    # Find a Dissassembly whose range the address belongs to (assuming a is sorted on start_address)
+    # Find a Dissassembly whose range the address belongs to
     def get_by_address(self, address):
         if isinstance(address, lldb.SBAddress):
             address = address.GetLoadAddress(self.target)
-        a = self.by_address
-        i  = upper_bound(a, address, lambda dasm: dasm.start_address) - 1
-        if i >= 0 and a[i].start_address <= address < a[i].end_address:
-            return a[i]
-        else:
-            return None
+        dasm = self.by_address.find(address)
+        return self.use(dasm) if dasm is not None else None
 
     def insert(self, dasm):
         log.info('Adding disassembled range 0x%x-0x%x', dasm.start_address, dasm.end_address)
-        a = self.by_address
-        i = lower_bound(a, dasm.start_address, lambda dasm: dasm.start_address)
-        assert i == len(a) or dasm.start_address != a[i].start_address
-        a.insert(i, dasm)
+        self.by_address.insert(dasm)
         dasm.source_ref = self.by_handle.create(dasm)
 
+    # Yields `count` instructions, starting `instruction_offset` instructions away from the one at `address`,
+    # as (DisassembledRange, start_index, end_index) chunks, disassembling adjacent code as needed.
+    # Where no instructions are available, yields (None, placeholder_address, number_of_instructions).
+    # Each chunk must be consumed before advancing the iterator, since that may evict ranges yielded earlier.
+    def iter_instruction_page(self, address, instruction_offset, count):
+        dasm = self.get_or_create(address)
+        if dasm is None:
+            yield None, address, count
+            return
+        index = dasm.instruction_index(address) + instruction_offset
+        # Walk backwards; we only do this when there's a symbol to anchor disassembly at,
+        # since instruction boundaries cannot be determined when going backwards.
+        while index < 0:
+            prev_address = dasm.start_address - 1
+            prev = self.get_by_address(prev_address)
+            if prev is None:
+                sbaddr = lldb.SBAddress(prev_address, self.target)
+                if sbaddr.GetSymbol().IsValid():
+                    prev = self.create_from_address(sbaddr)
+            num_preceding = prev.instruction_index(dasm.start_address - 1) + 1 if prev is not None else 0
+            if num_preceding <= 0:
+                break
+            index += num_preceding
+            dasm = prev
+        if index < 0:
+            num_missing = min(-index, count)
+            yield None, dasm.start_address - (-index), num_missing
+            count -= num_missing
+            index = 0
+        # Walk forward
+        while count > 0:
+            num_instructions = dasm.num_instructions()
+            if index < num_instructions:
+                end = min(num_instructions, index + count)
+                yield dasm, index, end
+                count -= end - index
+                index = 0
+            else:
+                index -= num_instructions
+            if count > 0:
+                next_address = dasm.end_address
+                dasm = self.get_or_create(next_address)
+                if dasm is None:
+                    yield None, next_address, count
+                    return
+                index += dasm.instruction_index(next_address)
+
+    def get_or_create(self, address):
+        dasm = self.get_by_address(address)
+        if dasm is None:
+            dasm = self.create_from_address(lldb.SBAddress(address, self.target))
+            if dasm is not None and not (dasm.start_address <= address < dasm.end_address):
+                dasm = None # Could not disassemble
+        return dasm
+
+    # Marks dasm as the most recently used, re-disassembling it if needed, and evicts the least recently
+    # used ones if we are over budget.
+    def use(self, dasm):
+        loaded = self.loaded
+        if loaded.pop(dasm.source_ref, None) is None:
+            if not dasm.is_loaded():
+                log.info('Reloading disassembled range 0x%x-0x%x', dasm.start_address, dasm.end_address)
+                cached = self.cache.load(dasm.cache_key) if dasm.cache_key is not None else None
+                if cached is not None:
+                    dasm.set_cached_lines(*cached)
+                else:
+                    dasm.load()
+            self.loaded_bytes += dasm.memory_size()
+        loaded[dasm.source_ref] = dasm
+        while self.loaded_bytes > self.max_bytes and len(loaded) > 1:
+            source_ref, evicted = loaded.popitem(last=False)
+            log.info('Evicting disassembled range 0x%x-0x%x', evicted.start_address, evicted.end_address)
+            self.loaded_bytes -= evicted.memory_size()
+            evicted.release()
+        return dasm
+
 class DisassembledRange:
     start_sbaddr = None # SBAddress
     start_address = None # physical address
     end_address = None # physical address
     target = None
     source_ref = None
+    cache = None # disasmcache.DisassemblyCache
+    cache_key = None
 
     def __init__(self, target, start_sbaddr, end_sbaddr, instructions):
         self.target = target
@@ -95,19 +280,74 @@ class DisassembledRange:
         self.end_sbaddr = end_sbaddr
         self.start_address = start_sbaddr.GetLoadAddress(target)
         self.end_address = end_sbaddr.GetLoadAddress(target)
-        self.instructions = instructions
         self.source_name = "@%x..%x" % (self.start_address, self.end_address)
+        if instructions is not None:
+            self.set_instructions(instructions)
+
+    def set_instructions(self, instructions):
+        self.instructions = instructions
+        self.cached_lines = None
+        self.source_text = None
         self.line_addresses = [-1, -1] # addresses corresponding to source lines (-1 = comment)
         for instr in self.instructions:
             self.line_addresses.append(instr.GetAddress().GetLoadAddress(self.target))
 
+    # Initializes from the persistent cache; instructions will be disassembled only if needed.
+    def set_cached_lines(self, addresses, lines):
+        self.instructions = None
+        self.cached_lines = lines
+        self.source_text = None
+        self.line_addresses = [-1, -1] + addresses
+
+    def is_loaded(self):
+        return self.line_addresses is not None
+
+    # Re-creates instructions from the address range, the same way it's done for `adapterData`.
+    def load(self):
+        self.set_instructions(read_instructions(self.target, self.start_sbaddr, self.end_address))
+
+    def release(self):
+        self.instructions = None
+        self.cached_lines = None
+        self.line_addresses = None
+        self.source_text = None
+
+    def get_instructions(self):
+        if self.instructions is None:
+            self.instructions = read_instructions(self.target, self.start_sbaddr, self.end_address)
+        return self.instructions
+
+    def memory_size(self):
+        return (len(self.line_addresses) - 2) * INSTRUCTION_COST
+
     def line_num_by_address(self, load_addr):
-        return lower_bound(self.line_addresses, load_addr) + 1 # lines numbers are 1-based
+        return bisect.bisect_left(self.line_addresses, load_addr) + 1 # lines numbers are 1-based
 
     def address_by_line_num(self, line_num):
         return self.line_addresses[line_num - 1]
 
+    # Index of the instruction containing load_addr.
+    def instruction_index(self, load_addr):
+        return bisect.bisect_right(self.line_addresses, load_addr) - 3 # Two header lines
+
+    # The number of instructions within [start_address, end_address).
+    def num_instructions(self):
+        return bisect.bisect_left(self.line_addresses, self.end_address) - 2
+
     def get_source_text(self):
+        if self.source_text is None:
+            instr_lines = self.cached_lines
+            if instr_lines is None:
+                instr_lines = []
+                for start in range(0, len(self.line_addresses) - 2, RENDER_CHUNK):
+                    instr_lines.extend(self.render_instructions(start, start + RENDER_CHUNK))
+                if self.cache_key is not None:
+                    self.cache.store(self.cache_key, self.line_addresses[2:], instr_lines)
+            self.cached_lines = None
+            self.source_text = '\n'.join(self.get_header_lines() + instr_lines)
+        return self.source_text
+
+    def get_header_lines(self):
         line_entry = self.start_sbaddr.GetLineEntry()
         if line_entry.IsValid():
             source_location = '%s:%d' % (line_entry.GetFileSpec(), line_entry.GetLine())
@@ -120,27 +360,115 @@ class DisassembledRange:
             description = desc.GetData()
         else:
             description = 'No symbol info'
-
-        lines = [
+        return [
             '; %s' % description,
             '; Source location: %s' % source_location ]
-        dump = []
-        for instr in self.instructions:
-            addr = instr.GetAddress().GetLoadAddress(self.target)
-            del dump[:]
-            for i,b in enumerate(instr.GetData(self.target).uint8):
-                if i >= MAX_INSTR_BYTES:
-                    dump.append('>')
-                    break
-                dump.append('%02X ' % b)
-            comment = instr.GetComment(self.target)
+
+    # Renders lines for instructions[start:end].
+    def render_instructions(self, start, end):
+        target = self.target
+        lines = []
+        for instr, addr, hex_bytes, num_bytes in self.iter_instructions(start, end, MAX_INSTR_BYTES):
+            dump = format_hex_bytes(hex_bytes) + ' '
+            if num_bytes > MAX_INSTR_BYTES:
+                dump += '>'
+            comment = instr.GetComment(target)
             line = '%08X: %s %-6s %s%s%s' % (
                 addr,
-                ''.join(dump).ljust(MAX_INSTR_BYTES * 3 + 2),
-                instr.GetMnemonic(self.target),
-                instr.GetOperands(self.target),
+                dump.ljust(MAX_INSTR_BYTES * 3 + 2),
+                instr.GetMnemonic(target),
+                instr.GetOperands(target),
                 '  ; ' if len(comment) > 0 else '',
                 comment
             )
             lines.append(line)
-        return '\n'.join(lines)
+        return lines
+
+    # Yields (SBInstruction, load address, hex-encoded bytes, number of bytes) for instructions[start:end],
+    # with hex-encoded bytes truncated to max_bytes.
+    # Instruction bytes are read from the debuggee in one go and hex-encoded in bulk; instruction boundaries
+    # are taken from line_addresses.
+    def iter_instructions(self, start, end, max_bytes):
+        instructions = self.get_instructions()
+        target = self.target
+        addresses = self.line_addresses[2:] # Skip the header lines
+        end = min(end, len(addresses))
+        if start >= end:
+            return
+        range_start = addresses[start]
+        range_end = addresses[end] if end < len(addresses) else \
+                    addresses[end-1] + instructions[end-1].GetByteSize()
+        hex_data = None
+        if 0 < range_end - range_start <= (end - start) * MAX_INSTR_LENGTH:
+            error = lldb.SBError()
+            data = target.ReadMemory(lldb.SBAddress(range_start, target), range_end - range_start, error)
+            if error.Success():
+                hex_data = binascii.hexlify(data).decode('ascii').upper()
+
+        for i in range(start, end):
+            instr = instructions[i]
+            addr = addresses[i]
+            if hex_data is not None:
+                next_addr = addresses[i+1] if i+1 < len(addresses) else range_end
+                offset = (addr - range_start) * 2
+                num_bytes = next_addr - addr
+                hex_bytes = hex_data[offset : offset + min(num_bytes, max_bytes) * 2]
+            else:
+                instr_data = bytearray(instr.GetData(target).uint8)
+                num_bytes = len(instr_data)
+                hex_bytes = binascii.hexlify(instr_data[:max_bytes]).decode('ascii').upper()
+            yield instr, addr, hex_bytes, num_bytes
+
+# 'AABBCC' -> 'AA BB CC'
+def format_hex_bytes(hex_bytes):
+    return ' '.join([hex_bytes[i:i+2] for i in range(0, len(hex_bytes), 2)])
+
+# --- Tests ---
+
+class TestRange:
+    def __init__(self, start_address, end_address):
+        self.start_address = start_address
+        self.end_address = end_address
+
+def test_interval_index():
+    index = IntervalIndex()
+    outer = TestRange(0x1000, 0x2000)
+    inner = TestRange(0x1100, 0x1200)
+    after = TestRange(0x2000, 0x2100)
+    late = TestRange(0x1180, 0x1a00)
+    for r in [after, inner, outer, late]:
+        index.insert(r)
+    assert len(index) == 4
+    assert index.find(0xfff) is None
+    assert index.find(0x1000) is outer
+    assert index.find(0x1150) is inner
+    assert index.find(0x1190) is late
+    assert index.find(0x1a00) is outer
+    assert index.find(0x1fff) is outer
+    assert index.find(0x2000) is after
+    assert index.find(0x2100) is None
+
+def test_interval_index_nested():
+    index = IntervalIndex()
+    inner = [TestRange(0x1000 + i * 0x10, 0x1008 + i * 0x10) for i in range(100)]
+    for r in inner:
+        index.insert(r)
+    outer = TestRange(0x800, 0x2000)
+    index.insert(outer)
+    assert len(index) == 101
+    assert index.find(0x800) is outer
+    assert index.find(0x1000) is inner[0]
+    assert index.find(0x1008) is outer
+    assert index.find(0x1634) is inner[0x63]
+    assert index.find(0x1638) is outer
+    assert index.find(0x1fff) is outer
+    assert index.find(0x2000) is None
+    # Ranges starting at the same address: the one inserted later wins.
+    same = TestRange(0x1000, 0x1004)
+    index.insert(same)
+    assert index.find(0x1000) is same
+    assert index.find(0x1004) is inner[0]
+
+def run_tests():
+    test_interval_index()
+    test_interval_index_nested()
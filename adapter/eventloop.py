@@ -1,33 +1,99 @@
 import logging
-from . import PY2
-if PY2: import Queue as queue
-else: import queue
+import collections
+import threading
+import time
 
 log = logging.getLogger('eventloop')
 
 class EventLoop:
     def __init__(self, qsize=1024):
         self.stopping = False
-        self.queue = queue.Queue(qsize)
+        self.qsize = qsize
+        self.queue = collections.deque() # (target, args)
+        self.cond = threading.Condition() # Guards `queue`; notified whenever it changes.
 
     # Returns callable object that will dispatch a call to `target`
     # via this event loop's queue.
     def make_dispatcher(self, target):
         def dispatcher(*args):
             if not self.stopping:
-                try:
-                    self.queue.put((target, args), True, 1)
-                except queue.Full:
+                if not self.put((target, args), 1):
                     log.error('Queue is full, dropping event: %s(%s)', target, args)
         return dispatcher
 
+    # Appends an item to the queue, waiting up to `timeout` seconds for a free slot.  Returns False on timeout.
+    def put(self, item, timeout):
+        deadline = time.time() + timeout
+        with self.cond:
+            while len(self.queue) >= self.qsize:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return False
+                self.cond.wait(remaining)
+            self.queue.append(item)
+            self.cond.notify_all()
+        return True
+
+    def get(self):
+        with self.cond:
+            while not self.queue:
+                self.cond.wait()
+            item = self.queue.popleft()
+            self.cond.notify_all()
+        return item
+
+    # Removes calls at the head of the queue for as long as predicate(target, args) is true, and returns them.
+    # Lets a handler process requests that arrived back-to-back in one go.
+    def take_queued(self, predicate):
+        taken = []
+        with self.cond:
+            while self.queue and predicate(*self.queue[0]):
+                taken.append(self.queue.popleft())
+            if taken:
+                self.cond.notify_all()
+        return taken
+
     def run(self):
         log.info('Entering')
         self.stopping = False
         while not self.stopping:
-            target, args = self.queue.get()
+            target, args = self.get()
             target(*args)
 
     def stop(self):
         log.info('Stopping')
         self.stopping = True
+
+# --- Tests ---
+
+def test_take_queued():
+    calls = []
+    loop = EventLoop()
+    first = loop.make_dispatcher(lambda x: calls.append(('first', x)))
+    second = loop.make_dispatcher(lambda x: calls.append(('second', x)))
+    for x in [1, 2, 3]:
+        first(x)
+    second(4)
+    first(5)
+    taken = loop.take_queued(lambda target, args: args[0] < 3)
+    assert [args for target, args in taken] == [(1,), (2,)]
+    # Stops at the first call that does not match, even if later ones would.
+    taken = loop.take_queued(lambda target, args: args[0] != 4)
+    assert [args for target, args in taken] == [(3,)]
+    assert loop.take_queued(lambda target, args: args[0] == 5) == []
+    # The rest are still dispatched in order.
+    loop.make_dispatcher(loop.stop)()
+    loop.run()
+    assert calls == [('second', 4), ('first', 5)]
+
+def test_queue_full():
+    loop = EventLoop(qsize=2)
+    item = (None, ())
+    assert loop.put(item, 0) and loop.put(item, 0)
+    assert not loop.put(item, 0.01)
+    assert len(loop.take_queued(lambda target, args: True)) == 2
+    assert loop.put(item, 0)
+
+def run_tests():
+    test_take_queued()
+    test_queue_full()
@@ -4,6 +4,9 @@ import re
 import operator
 import lldb
 import os
+import time
+from . import xrange
+from .arrays import read_array, is_numeric_type
 
 log = logging.getLogger('expressions')
 
@@ -12,6 +15,12 @@ __all__ = ['init_formatters', 'analyze', 'PyEvalContext', 'Value', 'find_var_in_
 
 analyzed = {} # A list of type names we've already analyzed
 type_callbacks = { None: [] } # A per-language list of type analyzers
+seen_languages = set() # Source languages of values we've analyzed
+language_callback = None # Invoked with each source language, the first time a value of that language is analyzed
+
+CALLBACK_TIME_BUDGET = 0.25 # Type callbacks that take longer than this (seconds) are disabled till the next stop.
+disabled_callbacks = {} # { callback : type name on which it went over the budget }
+budget_reports = [] # Messages about disabled callbacks, not yet shown to the user
 
 # Register callback that will be invoked once on all matching SBType's before they are displayed by the debugger
 def register_type_callback(callback, language, type_class_mask):
@@ -28,15 +37,43 @@ def analyze(sbvalue):
     analyzed[qual_type_name] = True
 
     language = sbvalue.GetFrame().GetCompileUnit().GetLanguage()
+    if language not in seen_languages:
+        seen_languages.add(language)
+        if language_callback is not None:
+            language_callback(language)
     type_class = value_type.GetTypeClass()
 
-    # Run registered callbacks
-    for type_class_mask, callback in type_callbacks.get(None): # These get called for all languages
-        if type_class & type_class_mask != 0:
-            callback(value_type)
-    for type_class_mask, callback in type_callbacks.get(language, []):
-        if type_class & type_class_mask != 0:
-            callback(value_type)
+    # Run registered callbacks; those for all languages go first.
+    skipped = False
+    for callbacks in (type_callbacks.get(None), type_callbacks.get(language, [])):
+        for type_class_mask, callback in callbacks:
+            if type_class & type_class_mask != 0:
+                if callback in disabled_callbacks:
+                    skipped = True
+                    continue
+                run_type_callback(callback, value_type, qual_type_name)
+    if skipped:
+        del analyzed[qual_type_name] # Try again after the next stop.
+
+def run_type_callback(callback, value_type, type_name):
+    start = time.time()
+    callback(value_type)
+    elapsed = time.time() - start
+    if elapsed > CALLBACK_TIME_BUDGET:
+        disabled_callbacks[callback] = type_name
+        message = 'Type callback %s took %.2fs on %s, disabled till the next stop.' % (
+            getattr(callback, '__name__', callback), elapsed, type_name)
+        log.warning('%s', message)
+        budget_reports.append(message)
+
+# Called when the debuggee is resumed.
+def reset_type_callback_budgets():
+    disabled_callbacks.clear()
+
+def pop_budget_reports():
+    reports = budget_reports[:]
+    del budget_reports[:]
+    return reports
 
 def find_var_in_frame(sbframe, name):
     val = sbframe.FindVariable(name)
@@ -52,14 +89,44 @@ def find_var_in_frame(sbframe, name):
         val = sbframe.GetValueForVariablePath(name)
     return val
 
+# Results of find_var_in_frame() for the current stop, shared by all evaluation contexts:
+# { (thread id, frame id) : { name : SBValue or None if not found } }
+frame_vars_cache = {}
+frame_vars_stop = None # (process id, stop id) the cache is valid for
+
+# Returns the variable cache of a frame, clearing the whole cache if the process has stopped since it was filled.
+def get_frame_vars_cache(sbframe):
+    global frame_vars_stop
+    thread = sbframe.GetThread()
+    process = thread.GetProcess()
+    stop = (process.GetUniqueID(), process.GetStopID(True))
+    if stop != frame_vars_stop:
+        frame_vars_cache.clear()
+        frame_vars_stop = stop
+    return frame_vars_cache.setdefault((thread.GetThreadID(), sbframe.GetFrameID()), {})
+
+# Called when the debuggee is resumed.
+def clear_frame_vars_cache():
+    global frame_vars_stop
+    frame_vars_cache.clear()
+    frame_vars_stop = None
+
 # A dictionary-like object that fetches values from SBFrame (and caches them).
 class PyEvalContext(dict):
     def __init__(self, sbframe):
         self.sbframe = sbframe
+        self.frame_vars = None
 
     def __missing__(self, name):
-        val = find_var_in_frame(self.sbframe, name)
-        if val.IsValid():
+        if self.frame_vars is None:
+            self.frame_vars = get_frame_vars_cache(self.sbframe)
+        val = self.frame_vars.get(name, False)
+        if val is False:
+            val = find_var_in_frame(self.sbframe, name)
+            if not val.IsValid():
+                val = None # Remember misses too, since builtins and globals of the Python namespace end up here.
+            self.frame_vars[name] = val
+        if val is not None:
             val = Value(val)
             self.__setitem__(name, val)
             return val
@@ -68,10 +135,11 @@ class PyEvalContext(dict):
 
 # A wrapper around SBValue that overloads Python operators to do the right thing (well, mostly).
 class Value(object):
-    __slots__ = ['__sbvalue']
+    __slots__ = ['__sbvalue', '__layout']
 
     def __init__(self, sbvalue):
         self.__sbvalue = sbvalue
+        self.__layout = None
         analyze(sbvalue)
 
     @classmethod
@@ -87,15 +155,42 @@ class Value(object):
     def __repr__(self):
         return 'Value(' + str(get_value(self)) + ')'
 
+    # Item layout of pointers and arrays, see get_item_layout(); computed on first use.
+    def __get_layout(self):
+        if self.__layout is None:
+            self.__layout = get_item_layout(self.__sbvalue)
+        return self.__layout
+
     def __getitem__(self, key):
+        layout = self.__get_layout()
         if not isinstance(key, slice):
-            child_sbvalue = (self.__sbvalue.GetValueForExpressionPath("[%i]" % operator.index(key)))
+            index = operator.index(key)
+            if layout is not None:
+                item_type, item_size, count = layout
+                if count is not None and index < 0:
+                    index += count
+                if count is None or 0 <= index < count:
+                    return Value(self.__sbvalue.CreateChildAtOffset('[%d]' % index, index * item_size, item_type))
+                raise IndexError("Index '%d' is out of range" % key)
+            child_sbvalue = (self.__sbvalue.GetValueForExpressionPath("[%i]" % index))
             if child_sbvalue and child_sbvalue.IsValid():
                 return Value(child_sbvalue)
             raise IndexError("Index '%d' is out of range" % key)
         else:
-            return [self[i] for i in xrange(*key.indices(len(self)))]
+            # Slices are lists of Values, like items obtained by indexing; use to_array() to read numbers in bulk.
+            if layout is not None:
+                item_type, item_size, count = layout
+                if count is None: # Pointers have no length, so bounds must be explicit.
+                    if key.stop is None or min(key.start or 0, key.stop) < 0:
+                        raise IndexError('Pointer slices require non-negative start and stop')
+                    indices = xrange(key.start or 0, key.stop, key.step or 1)
+                else:
+                    indices = xrange(*key.indices(count))
+            else:
+                indices = xrange(*key.indices(len(self)))
+            return [self[i] for i in indices]
 
+    # Iteration yields Values; use to_array() to read numeric items in bulk.
     def __iter__(self):
         return ValueIter(self.__sbvalue)
 
@@ -147,6 +242,10 @@ class Value(object):
     def __len__(self):
         return self.__sbvalue.GetNumChildren()
 
+    # See read_array()
+    def to_array(self, shape=None, dtype=None, strides=None):
+        return read_array(self.__sbvalue, shape, dtype, strides)
+
     # On-the-left ops
     def __add__(self, other):
         return get_value(self) + get_value(other)
@@ -336,43 +435,24 @@ def get_value(v):
     else:
         return v # passthrough
 
-# given an lldb.SBBasicType it returns a tuple (is_numeric, is_signed, is_float)
-def is_numeric_type(basic_type):
-    return type_traits.get(basic_type, (False, False, False))
-type_traits = {
-    lldb.eBasicTypeInvalid: (False, False, False),
-    lldb.eBasicTypeVoid: (False, False, False),
-    lldb.eBasicTypeChar: (True, False, False),
-    lldb.eBasicTypeSignedChar: (True, True, False),
-    lldb.eBasicTypeUnsignedChar: (True, False, False),
-    lldb.eBasicTypeWChar: (True, False, False),
-    lldb.eBasicTypeSignedWChar: (True, True, False),
-    lldb.eBasicTypeUnsignedWChar: (True, False, False),
-    lldb.eBasicTypeChar16: (True, False, False),
-    lldb.eBasicTypeChar32: (True, False, False),
-    lldb.eBasicTypeShort: (True, True, False),
-    lldb.eBasicTypeUnsignedShort: (True, False, False),
-    lldb.eBasicTypeInt: (True, True, False),
-    lldb.eBasicTypeUnsignedInt: (True, False, False),
-    lldb.eBasicTypeLong: (True, True, False),
-    lldb.eBasicTypeUnsignedLong: (True, False, False),
-    lldb.eBasicTypeLongLong: (True, True, False),
-    lldb.eBasicTypeUnsignedLongLong: (True, False, False),
-    lldb.eBasicTypeInt128: (True, True, False),
-    lldb.eBasicTypeUnsignedInt128: (True, False, False),
-    lldb.eBasicTypeBool: (False, False, False),
-    lldb.eBasicTypeHalf: (True, True, True),
-    lldb.eBasicTypeFloat: (True, True, True),
-    lldb.eBasicTypeDouble: (True, True, True),
-    lldb.eBasicTypeLongDouble: (True, True, True),
-    lldb.eBasicTypeFloatComplex: (True, True, False),
-    lldb.eBasicTypeDoubleComplex: (True, True, False),
-    lldb.eBasicTypeLongDoubleComplex: (True, True, False),
-    lldb.eBasicTypeObjCID: (False, False, False),
-    lldb.eBasicTypeObjCClass: (False, False, False),
-    lldb.eBasicTypeObjCSel: (False, False, False),
-    lldb.eBasicTypeNullPtr: (False, False, False),
-}
+# Returns (item type, item size, number of items or None for pointers) for pointers and arrays;
+# None for other values, which are indexed via expression paths.
+def get_item_layout(sbvalue):
+    if sbvalue.IsSynthetic():
+        return None
+    value_type = sbvalue.GetType().GetCanonicalType()
+    type_class = value_type.GetTypeClass()
+    if type_class == lldb.eTypeClassPointer:
+        item_type = value_type.GetPointeeType()
+    elif type_class == lldb.eTypeClassArray:
+        item_type = value_type.GetArrayElementType()
+    else:
+        return None
+    item_size = item_type.GetByteSize()
+    if item_size == 0:
+        return None
+    count = value_type.GetByteSize() // item_size if type_class == lldb.eTypeClassArray else None
+    return item_type, item_size, count
 
 # Matches Python strings
 pystring = '|'.join([
@@ -521,9 +601,54 @@ def test_escape_variable_name():
     assert escape_variable_name('foo::bar<34>') == '${foo::bar<34>}'
     assert escape_variable_name('foo::bar<34>::value') == '${foo::bar<34>::value}'
 
+def test_frame_vars_cache():
+    lookups = []
+    class Process:
+        stop_id = 1
+        def GetUniqueID(self): return 1
+        def GetStopID(self, include_expression_stops): return self.stop_id
+    process = Process()
+    class Thread:
+        def GetProcess(self): return process
+        def GetThreadID(self): return 1
+    class Frame:
+        def GetThread(self): return Thread()
+        def GetFrameID(self): return 0
+        def FindVariable(self, name):
+            lookups.append(name)
+            return lldb.SBValue()
+        def FindValue(self, name, value_type): return lldb.SBValue()
+        def GetValueForVariablePath(self, name): return lldb.SBValue()
+    frame = Frame()
+    for i in range(3):
+        assert eval('len([1])', {}, PyEvalContext(frame)) == 1
+    assert lookups == ['len']
+    process.stop_id += 1
+    assert eval('len([1])', {}, PyEvalContext(frame)) == 1
+    clear_frame_vars_cache()
+    assert eval('len([1])', {}, PyEvalContext(frame)) == 1
+    assert lookups == ['len', 'len', 'len']
+
+def test_value_slices():
+    import struct
+    process = lldb.SBProcess()
+    i32 = lldb.basic_type('i32', 4, lldb.eBasicTypeInt)
+    value = Value(lldb.create_value(process, 'a', i32.GetArrayType(5), struct.pack('<5i', 0, 1, 2, 3, 4)))
+    items = value[1:4]
+    assert all(type(item) is Value for item in items)
+    assert [get_value(item) for item in items] == [1, 2, 3]
+    assert Value.unwrap(value[:][0]).GetValueAsSigned() == 0
+    assert bool(value[:][0]) == bool(value[0])
+    assert [get_value(item) for item in value[::-2]] == [4, 2, 0]
+    pointer = Value(lldb.create_value(process, 'p', i32.GetPointerType(),
+                                      struct.pack('<Q', Value.unwrap(value).GetLoadAddress())))
+    assert [get_value(item) for item in pointer[2:5]] == [2, 3, 4]
+
 def run_tests():
     #print preprocess_simple_regex.pattern
     #print preprocess_python_regex.pattern
     test_preprocess_simple()
     test_preprocess_python()
     test_escape_variable_name()
+    test_value_slices()
+    test_frame_vars_cache()
@@ -0,0 +1,32 @@
+import logging
+import time
+
+log = logging.getLogger('fsutil')
+
+# Memoizes a path resolution function, including the negative (None) results.
+# Entries expire after `ttl` seconds, so that source files created or deleted while
+# the debug session is running are eventually noticed.
+class PathCache:
+    def __init__(self, resolve, ttl=10):
+        self.resolve = resolve
+        self.ttl = ttl
+        self.entries = {} # { path : (result, expiration_time) }
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, path):
+        now = time.time()
+        entry = self.entries.get(path)
+        if entry is not None and entry[1] > now:
+            self.hits += 1
+            return entry[0]
+        self.misses += 1
+        result = self.resolve(path)
+        self.entries[path] = (result, now + self.ttl)
+        return result
+
+    def clear(self):
+        self.entries.clear()
+
+    def log_stats(self):
+        log.info('Path cache: %d entries, %d hits, %d misses', len(self.entries), self.hits, self.misses)
@@ -40,7 +40,9 @@ class HandleTree:
             vpath = parent_info[1] + (key,)
         else:
             vpath = (key,)
-        handle = self.prev_handle_by_vpath.get(vpath)
+        handle = self.handle_by_vpath.get(vpath)
+        if handle is None:
+            handle = self.prev_handle_by_vpath.get(vpath)
         if handle is None:
             handle = self._next_handle()
         self.obj_by_handle[handle] = (value, vpath)
@@ -0,0 +1,140 @@
+import logging
+import collections
+import lldb
+
+log = logging.getLogger('memcache')
+
+PAGE_SIZE = 4096
+MAX_CHUNK = 1024 * 1024 # Max size of a single read from the debuggee.
+MAX_CACHED_PAGES = 16 * 1024 # 64MB worth of pages.
+
+# Caches debuggee memory in pages, for the duration of a stop.
+# Consecutive missing pages are read from the debuggee in large chunks; if a chunk cannot be read as a whole,
+# it is re-read page by page, and pages that fail are remembered as unreadable.
+class MemoryCache:
+    def __init__(self, read_memory, max_pages=MAX_CACHED_PAGES):
+        self.read_memory = read_memory # (address, size) -> bytes or None
+        self.pages = collections.OrderedDict() # { page address : bytes or None (unreadable) } in LRU order
+        self.max_pages = max_pages
+
+    def clear(self):
+        self.pages.clear()
+
+    # Drops cached pages overlapping [address, address + size)
+    def invalidate(self, address, size):
+        page = address - address % PAGE_SIZE
+        while page < address + size:
+            self.pages.pop(page, None)
+            page += PAGE_SIZE
+
+    # Returns (data, number of unreadable bytes following the data) for the range [address, address + size).
+    # The data is a bytearray of the readable prefix of the range.
+    def read(self, address, size):
+        end = address + size
+        page = address - address % PAGE_SIZE
+        # Pages are assembled as soon as they are loaded, a window at a time, so that reads larger than
+        # the cache do not evict their own pages before they are used.
+        window = min(MAX_CHUNK, self.max_pages * PAGE_SIZE)
+        data = bytearray()
+        unreadable = 0
+        while page < end:
+            window_end = min(end, page + window)
+            self.load(page, window_end)
+            while page < window_end:
+                page_data = self.get_page(page)
+                start = max(address, page) - page
+                stop = min(end, page + PAGE_SIZE) - page
+                if page_data is None:
+                    unreadable += stop - start
+                elif unreadable > 0:
+                    return data, unreadable
+                else:
+                    data += memoryview(page_data)[start:stop]
+                page += PAGE_SIZE
+        return data, unreadable
+
+    def get_page(self, page):
+        page_data = self.pages.pop(page)
+        self.pages[page] = page_data # Mark as most recently used
+        return page_data
+
+    # Makes sure that all pages in [page, end) are in the cache.
+    def load(self, page, end):
+        while page < end:
+            if page in self.pages:
+                page += PAGE_SIZE
+                continue
+            # Find the run of missing pages, up to MAX_CHUNK bytes.
+            run_end = page + PAGE_SIZE
+            while run_end < end and run_end - page < MAX_CHUNK and run_end not in self.pages:
+                run_end += PAGE_SIZE
+            chunk = self.read_memory(page, run_end - page)
+            if chunk is not None:
+                view = memoryview(chunk)
+                for offset in range(0, run_end - page, PAGE_SIZE):
+                    self.add_page(page + offset, view[offset : offset + PAGE_SIZE].tobytes())
+            elif run_end - page == PAGE_SIZE:
+                self.add_page(page, None)
+            else:
+                for p in range(page, run_end, PAGE_SIZE):
+                    self.add_page(p, self.read_memory(p, PAGE_SIZE))
+            page = run_end
+
+    def add_page(self, page, page_data):
+        self.pages[page] = page_data
+        while len(self.pages) > self.max_pages:
+            self.pages.popitem(last=False)
+
+def process_reader(process):
+    def read_memory(address, size):
+        error = lldb.SBError()
+        data = process.ReadMemory(address, size, error)
+        return data if error.Success() else None
+    return read_memory
+
+# --- Tests ---
+
+# Returns a read_memory function over `memory` placed at `base`, which fails unless the whole block being read
+# lies within one of the `readable` [(start, end)] ranges.  Calls are recorded in `reads`.
+def make_test_reader(memory, base, readable, reads):
+    def read_memory(address, size):
+        reads.append((address, size))
+        if not any(start <= address and address + size <= end for start, end in readable):
+            return None
+        return bytes(memory[address - base : address - base + size])
+    return read_memory
+
+def test_read():
+    memory = bytearray(i % 251 for i in range(0x5000))
+    reads = []
+    cache = MemoryCache(make_test_reader(memory, 0x10000, [(0x10000, 0x13000), (0x14000, 0x15000)], reads))
+    data, unreadable = cache.read(0x10010, 0x2000)
+    assert data == memory[0x10 : 0x2010] and unreadable == 0
+    assert reads == [(0x10000, 0x3000)]
+    del reads[:]
+    data, unreadable = cache.read(0x10ff0, 0x20) # Cached
+    assert data == memory[0xff0 : 0x1010] and unreadable == 0
+    assert reads == []
+    data, unreadable = cache.read(0x12ff0, 0x1020) # Crosses into unreadable page
+    assert data == memory[0x2ff0 : 0x3000] and unreadable == 0x1000
+    # The run of missing pages is unreadable as a whole, so it is re-read page by page.
+    assert reads == [(0x13000, 0x2000), (0x13000, 0x1000), (0x14000, 0x1000)]
+    del reads[:]
+    data, unreadable = cache.read(0x13800, 0x1000) # Starts in unreadable page
+    assert len(data) == 0 and unreadable == 0x800
+    assert reads == []
+    cache.invalidate(0x10010, 1)
+    memory[0x10] = 0
+    data, unreadable = cache.read(0x10010, 1)
+    assert data == bytearray([0])
+
+def test_read_larger_than_cache():
+    memory = bytearray(i % 251 for i in range(0x6000))
+    cache = MemoryCache(make_test_reader(memory, 0x10000, [(0x10000, 0x16000)], []), max_pages=4)
+    data, unreadable = cache.read(0x10000, 0x6000)
+    assert data == memory and unreadable == 0
+    assert len(cache.pages) == 4
+
+def run_tests():
+    test_read()
+    test_read_larger_than_cache()
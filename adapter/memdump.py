@@ -0,0 +1,87 @@
+import time
+import logging
+from . import memcache
+
+log = logging.getLogger('memdump')
+
+CHUNK_SIZE = 4 * 1024 * 1024 # Size of a single read; this is all the dump keeps in memory at a time.
+PROGRESS_INTERVAL = 5 # Seconds between progress reports.
+
+# Statistics of a completed dump.
+class DumpStats:
+    def __init__(self, size, unreadable, elapsed):
+        self.size = size
+        self.unreadable = unreadable # Number of unreadable bytes, which were written out as zeroes.
+        self.elapsed = elapsed
+
+    def throughput(self):
+        return self.size / self.elapsed if self.elapsed > 0 else float('inf')
+
+    def __str__(self):
+        text = 'Wrote %s in %.2fs (%s/s)' % (format_size(self.size), self.elapsed, format_size(self.throughput()))
+        if self.unreadable:
+            text += ', %s unreadable' % format_size(self.unreadable)
+        return text
+
+# Streams [address, address + size) to `file` in chunks of `chunk_size` bytes.
+# Chunks that cannot be read as a whole are re-read page by page, and unreadable pages are written out as zeroes,
+# so that file offsets always correspond to addresses.
+# `read_memory` is (address, size) -> bytes or None; `progress` is called with (bytes done, bytes total).
+def dump_memory(read_memory, address, size, file, chunk_size=CHUNK_SIZE, progress=None):
+    start = time.time()
+    next_report = start + PROGRESS_INTERVAL
+    end = address + size
+    unreadable = 0
+    while address < end:
+        # Align chunks to page boundaries, so that the per-page fallback never straddles a page.
+        chunk_end = min(end, address - address % memcache.PAGE_SIZE + chunk_size)
+        data = read_memory(address, chunk_end - address)
+        if data is not None:
+            file.write(data)
+        else:
+            page = address
+            while page < chunk_end:
+                page_end = min(chunk_end, page - page % memcache.PAGE_SIZE + memcache.PAGE_SIZE)
+                data = read_memory(page, page_end - page)
+                if data is None:
+                    data = b'\0' * (page_end - page)
+                    unreadable += page_end - page
+                file.write(data)
+                page = page_end
+        address = chunk_end
+        if progress is not None and time.time() >= next_report:
+            progress(size - (end - address), size)
+            next_report = time.time() + PROGRESS_INTERVAL
+    return DumpStats(size, unreadable, time.time() - start)
+
+def format_size(size):
+    for unit in ['B', 'KB', 'MB']:
+        if size < 1024:
+            return '%.1f%s' % (size, unit) if unit != 'B' else '%d%s' % (size, unit)
+        size /= 1024.0
+    return '%.1fGB' % size
+
+# --- Tests ---
+
+def test_dump_memory():
+    import io
+    memory = bytearray(i % 251 for i in range(0x6000))
+    reads = []
+    read_memory = memcache.make_test_reader(memory, 0x10000, [(0x10000, 0x13000), (0x14000, 0x16000)], reads)
+    file = io.BytesIO()
+    stats = dump_memory(read_memory, 0x10800, 0x2000, file, chunk_size=0x2000)
+    assert file.getvalue() == memory[0x800 : 0x2800] and stats.unreadable == 0
+    assert reads == [(0x10800, 0x1800), (0x12000, 0x800)]
+    file = io.BytesIO()
+    stats = dump_memory(read_memory, 0x12800, 0x2000, file, chunk_size=0x2000)
+    assert file.getvalue() == memory[0x2800 : 0x3000] + b'\0' * 0x1000 + memory[0x4000 : 0x4800]
+    assert stats.unreadable == 0x1000 and stats.size == 0x2000
+
+def test_format_size():
+    assert format_size(100) == '100B'
+    assert format_size(1536) == '1.5KB'
+    assert format_size(3 * 1024**3) == '3.0GB'
+
+def run_tests():
+    test_dump_memory()
+    test_format_size()
@@ -0,0 +1,150 @@
+import os
+import re
+import logging
+
+log = logging.getLogger('sourcemap')
+
+# When None is a valid dictionary entry value, we need some other value to designate missing entries.
+MISSING = ()
+
+# Path components may be separated by either kind of slash, since the debuggee may have been
+# built on a different OS.
+separators_regex = re.compile(r'[\\/]+')
+
+def split_path(path):
+    return separators_regex.split(path.rstrip('\\/'))
+
+# Translates source paths recorded in debug info into local paths.
+# - `source_map` is a dictionary of remote path prefixes to local ones.  The local prefix may be None,
+#   which means that sources under this remote prefix should be suppressed.
+# - `search_roots` is a list of local directories that are searched for sources not covered by source_map,
+#   whose original directory does not exist locally.
+# Remote prefixes are stored in a trie of path components, so that a lookup is linear in the length of the path.
+# Results are memoized per directory, so that we never touch the file system more than once per directory.
+class SourceMap:
+    def __init__(self, source_map=None, search_roots=None, is_dir=os.path.isdir):
+        self.trie = {} # { component : node }; the local prefix of a mapping is stored under the MISSING key.
+        self.search_roots = search_roots or []
+        self.is_dir = is_dir
+        self.dir_cache = {} # { remote_dir : local_dir }
+        if source_map:
+            for remote_prefix, local_prefix in source_map.items():
+                self.add_mapping(remote_prefix, local_prefix)
+
+    def add_mapping(self, remote_prefix, local_prefix):
+        node = self.trie
+        for component in split_path(remote_prefix):
+            node = node.setdefault(component, {})
+        node[MISSING] = local_prefix
+        self.dir_cache.clear()
+
+    def is_empty(self):
+        return len(self.trie) == 0 and len(self.search_roots) == 0
+
+    # Returns local path corresponding to `path`, or None if the source should be suppressed.
+    def resolve(self, path):
+        split = max(path.rfind('/'), path.rfind('\\')) + 1
+        if split == 0: # No directory component
+            return path
+        remote_dir = path[:split]
+        local_dir = self.dir_cache.get(remote_dir, MISSING)
+        if local_dir is MISSING:
+            local_dir = self.resolve_dir(remote_dir)
+            self.dir_cache[remote_dir] = local_dir
+        if local_dir is None:
+            return None
+        if local_dir == remote_dir:
+            return path
+        return os.path.join(local_dir, path[split:])
+
+    def resolve_dir(self, remote_dir):
+        components = split_path(remote_dir)
+        # Find the longest matching remote prefix.
+        node = self.trie
+        local_prefix = MISSING
+        matched = 0
+        for i, component in enumerate(components):
+            node = node.get(component)
+            if node is None:
+                break
+            prefix = node.get(MISSING, MISSING)
+            if prefix is not MISSING:
+                local_prefix = prefix
+                matched = i + 1
+        if local_prefix is not MISSING:
+            if local_prefix is None:
+                return None
+            return os.path.join(local_prefix, *components[matched:])
+
+        if self.search_roots and not self.is_dir(remote_dir):
+            # Try progressively shorter tails of the remote directory under each of the search roots.
+            tail = [c for c in components if c]
+            for start in range(len(tail)):
+                for root in self.search_roots:
+                    candidate = os.path.join(root, *tail[start:])
+                    if self.is_dir(candidate):
+                        log.info('Found %s at %s', remote_dir, candidate)
+                        return candidate
+        return remote_dir
+
+# LLDB applies prefix mappings (target.source-map) before paths reach SourceMap, so suppressed prefixes must also be
+# matched in their translated form.  Returns { prefix : None } for each suppressed remote prefix, both as is and as
+# translated by the longest matching mapping that is not itself suppressed.
+def translate_suppressed(source_map):
+    mappings = SourceMap(dict((remote, local) for remote, local in source_map.items() if local is not None))
+    suppressed = {}
+    for remote_prefix, local_prefix in source_map.items():
+        if local_prefix is None:
+            suppressed[remote_prefix] = None
+            suppressed[mappings.resolve_dir(remote_prefix)] = None
+    return suppressed
+
+# --- Tests ---
+
+def test_resolve():
+    source_map = {
+        '/build': '/src/build',
+        '/build/gen': None,
+        '/build/third_party/zlib': '/opt/zlib',
+        '/build/third_party/zlib/contrib': None,
+        'C:\\work\\tmp': None,
+    }
+    # Paths arrive here already translated by LLDB's target.source-map.
+    suppressed = SourceMap(translate_suppressed(source_map))
+    assert suppressed.resolve('/src/build/foo/main.c') == '/src/build/foo/main.c'
+    assert suppressed.resolve(os.path.join('/src/build', 'gen', 'parser.c')) is None
+    assert suppressed.resolve(os.path.join('/opt/zlib', 'contrib', 'minizip.c')) is None
+    assert suppressed.resolve(os.path.join('/opt/zlib', 'inflate.c')) == os.path.join('/opt/zlib', 'inflate.c')
+    assert suppressed.resolve('/build/gen/lexer.c') is None # Not covered by any mapping
+    assert suppressed.resolve('C:\\work\\tmp\\lib.cpp') is None
+    assert suppressed.resolve('C:\\work\\proj\\lib.cpp') == 'C:\\work\\proj\\lib.cpp'
+    assert suppressed.resolve('main.c') == 'main.c'
+
+def test_prefix_mapping():
+    source_map = SourceMap({
+        '/build': '/src/build',
+        '/build/third_party/zlib': '/opt/zlib',
+        'C:\\work': '/home/user/work'
+    })
+    assert source_map.resolve('/build/foo/main.c') == os.path.join('/src/build', 'foo', 'main.c')
+    assert source_map.resolve('/build/third_party/zlib/inflate.c') == os.path.join('/opt/zlib', 'inflate.c')
+    assert source_map.resolve('C:\\work\\proj\\lib.cpp') == os.path.join('/home/user/work', 'proj', 'lib.cpp')
+    assert source_map.resolve('/buildbot/main.c') == '/buildbot/main.c'
+
+def test_search_roots():
+    existing = set(['/home/user/src/project/lib', '/opt/other'])
+    probes = []
+    def is_dir(path):
+        probes.append(path)
+        return path in existing
+    source_map = SourceMap({}, ['/opt/other', '/home/user/src'], is_dir)
+    assert source_map.resolve('/farm/agent7/project/lib/a.c') == os.path.join('/home/user/src/project/lib', 'a.c')
+    num_probes = len(probes)
+    assert source_map.resolve('/farm/agent7/project/lib/b.c') == os.path.join('/home/user/src/project/lib', 'b.c')
+    assert len(probes) == num_probes # Memoized per directory
+    assert source_map.resolve('/farm/agent7/nowhere/c.c') == '/farm/agent7/nowhere/c.c'
+
+def run_tests():
+    test_resolve()
+    test_prefix_mapping()
+    test_search_roots()
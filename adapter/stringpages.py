@@ -0,0 +1,80 @@
+import codecs
+import lldb
+
+MAX_PAGE_SIZE = 1024 * 1024 # Max number of bytes returned in one page.
+MEMORY_PAGE = 4096 # Reads of NUL-terminated strings are split at multiples of this, to stay within mapped memory.
+
+# Decodes a page of UTF-8 text, which may start and end in the middle of a character.
+# Returns (text, number of bytes skipped at the start, number of bytes consumed including the skipped ones).
+# Incomplete characters at the end of the page are left for the next page, unless `final` is True.
+def decode_utf8_page(data, final):
+    skipped = 0
+    # Skip continuation bytes of a character that started on the previous page.
+    while skipped < min(3, len(data)) and bytearray(data[skipped:skipped+1])[0] & 0xC0 == 0x80:
+        skipped += 1
+    decoder = codecs.getincrementaldecoder('utf-8')('replace')
+    text = decoder.decode(data[skipped:], final)
+    pending = decoder.getstate()[0]
+    return text, skipped, len(data) - len(pending)
+
+# Reads a page of a string located at `address`.
+# If `length` is None, the string is NUL-terminated, and the page ends at the first NUL.
+# Returns a dictionary suitable as a response body.
+def read_string_page(process, address, length, offset, count):
+    count = max(0, min(count, MAX_PAGE_SIZE))
+    if length is not None:
+        count = max(0, min(count, length - offset))
+        data = read_memory(process, address + offset, count)
+        done = offset + len(data) >= length or len(data) < count
+        nul_terminated = False
+    else:
+        data = read_memory(process, address + offset, count)
+        nul = data.find(b'\0')
+        nul_terminated = nul >= 0
+        if nul_terminated:
+            data = data[:nul]
+        done = nul_terminated or len(data) < count
+    text, skipped, consumed = decode_utf8_page(data, done)
+    next_offset = offset + consumed + (1 if nul_terminated else 0)
+    result = {
+        'text': text,
+        'offset': offset + skipped,
+        'nextOffset': next_offset,
+        'done': done
+    }
+    if length is not None:
+        result['totalLength'] = length
+    return result
+
+# Reads as much as possible of the range, stopping at the first unreadable memory page.
+def read_memory(process, address, count):
+    error = lldb.SBError()
+    data = process.ReadMemory(address, count, error) if count > 0 else b''
+    if error.Success():
+        return data
+    chunks = []
+    while count > 0:
+        size = min(count, MEMORY_PAGE - address % MEMORY_PAGE)
+        error = lldb.SBError()
+        data = process.ReadMemory(address, size, error)
+        if not error.Success():
+            break
+        chunks.append(data)
+        address += size
+        count -= size
+    return b''.join(chunks)
+
+# --- Tests ---
+
+def test_decode_utf8_page():
+    data = u'a\u00e9\u4e2d\U0001f600'.encode('utf-8') # 1, 2, 3 and 4 byte characters
+    assert decode_utf8_page(data, True) == (u'a\u00e9\u4e2d\U0001f600', 0, len(data))
+    # Ends in the middle of the last character
+    assert decode_utf8_page(data[:8], False) == (u'a\u00e9\u4e2d', 0, 6)
+    # Starts in the middle of a character
+    assert decode_utf8_page(data[2:], True) == (u'\u4e2d\U0001f600', 1, len(data) - 2)
+    # Invalid bytes get replaced
+    assert decode_utf8_page(b'a\xffb', True) == (u'a\ufffdb', 0, 3)
+
+def run_tests():
+    test_decode_utf8_page()
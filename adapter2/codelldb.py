@@ -181,14 +181,38 @@ def find_var_in_frame(sbframe, name):
         val = sbframe.GetValueForVariablePath(name)
     return val
 
+# Results of find_var_in_frame() for the current stop, shared by all evaluation contexts:
+# { (thread id, frame id) : { name : SBValue or None if not found } }
+frame_vars_cache = {}
+frame_vars_stop = None # (process id, stop id) the cache is valid for
+
+# Returns the variable cache of a frame, clearing the whole cache if the process has stopped since it was filled.
+def get_frame_vars_cache(sbframe):
+    global frame_vars_stop
+    thread = sbframe.GetThread()
+    process = thread.GetProcess()
+    stop = (process.GetUniqueID(), process.GetStopID(True))
+    if stop != frame_vars_stop:
+        frame_vars_cache.clear()
+        frame_vars_stop = stop
+    return frame_vars_cache.setdefault((thread.GetThreadID(), sbframe.GetFrameID()), {})
+
 # A dictionary-like object that fetches values from SBFrame (and caches them).
 class PyEvalContext(dict):
     def __init__(self, sbframe):
         self.sbframe = sbframe
+        self.frame_vars = None
 
     def __missing__(self, name):
-        val = find_var_in_frame(self.sbframe, name)
-        if val.IsValid():
+        if self.frame_vars is None:
+            self.frame_vars = get_frame_vars_cache(self.sbframe)
+        val = self.frame_vars.get(name, False)
+        if val is False:
+            val = find_var_in_frame(self.sbframe, name)
+            if not val.IsValid():
+                val = None # Remember misses too, since builtins and globals of the Python namespace end up here.
+            self.frame_vars[name] = val
+        if val is not None:
             val = Value(val)
             self.__setitem__(name, val)
             return val
@@ -2,6 +2,7 @@ import sys
 import lldb
 import codelldb
 from value import Value
+from arrays import read_array
 
 def evaluate(expr, unwrap=False):
     exec_context = lldb.SBExecutionContext(lldb.frame)
@@ -14,6 +15,10 @@ def wrap(obj):
 def unwrap(obj):
     return Value.unwrap(obj)
 
+# Reads items of a pointer or an array value into a NumPy array or an array.array; see arrays.read_array().
+def to_array(value, shape=None, dtype=None, strides=None):
+    return read_array(unwrap(value), shape, dtype, strides)
+
 def display_html(html, title=None, position=None, reveal=False):
     codelldb.display_html(html, title, position, reveal)
 
@@ -33,4 +38,4 @@ def stop_if(cond, handler):
     else:
         return False
 
-__all__ = ['evaluate', 'wrap', 'unwrap', 'display_html', 'register_type_callback', 'register_content_provider', 'stop_if']
+__all__ = ['evaluate', 'wrap', 'unwrap', 'to_array', 'display_html', 'register_type_callback', 'register_content_provider', 'stop_if']
@@ -1,5 +1,6 @@
 import lldb
 import operator
+from arrays import read_array, is_numeric_type
 
 # A wrapper around SBValue that overloads Python operators to do the right thing (well, mostly).
 class Value(object):
@@ -82,6 +83,10 @@ class Value(object):
     def __len__(self):
         return self.__sbvalue.GetNumChildren()
 
+    # See read_array()
+    def to_array(self, shape=None, dtype=None, strides=None):
+        return read_array(self.__sbvalue, shape, dtype, strides)
+
     # On-the-left ops
     def __add__(self, other):
         return get_value(self) + get_value(other)
@@ -271,40 +276,3 @@ def get_value(v):
     else:
         return v # passthrough
 
-# given an lldb.SBBasicType it returns a tuple (is_numeric, is_signed, is_float)
-def is_numeric_type(basic_type):
-    return type_traits.get(basic_type, (False, False, False))
-type_traits = {
-    lldb.eBasicTypeInvalid: (False, False, False),
-    lldb.eBasicTypeVoid: (False, False, False),
-    lldb.eBasicTypeChar: (True, False, False),
-    lldb.eBasicTypeSignedChar: (True, True, False),
-    lldb.eBasicTypeUnsignedChar: (True, False, False),
-    lldb.eBasicTypeWChar: (True, False, False),
-    lldb.eBasicTypeSignedWChar: (True, True, False),
-    lldb.eBasicTypeUnsignedWChar: (True, False, False),
-    lldb.eBasicTypeChar16: (True, False, False),
-    lldb.eBasicTypeChar32: (True, False, False),
-    lldb.eBasicTypeShort: (True, True, False),
-    lldb.eBasicTypeUnsignedShort: (True, False, False),
-    lldb.eBasicTypeInt: (True, True, False),
-    lldb.eBasicTypeUnsignedInt: (True, False, False),
-    lldb.eBasicTypeLong: (True, True, False),
-    lldb.eBasicTypeUnsignedLong: (True, False, False),
-    lldb.eBasicTypeLongLong: (True, True, False),
-    lldb.eBasicTypeUnsignedLongLong: (True, False, False),
-    lldb.eBasicTypeInt128: (True, True, False),
-    lldb.eBasicTypeUnsignedInt128: (True, False, False),
-    lldb.eBasicTypeBool: (False, False, False),
-    lldb.eBasicTypeHalf: (True, True, True),
-    lldb.eBasicTypeFloat: (True, True, True),
-    lldb.eBasicTypeDouble: (True, True, True),
-    lldb.eBasicTypeLongDouble: (True, True, True),
-    lldb.eBasicTypeFloatComplex: (True, True, False),
-    lldb.eBasicTypeDoubleComplex: (True, True, False),
-    lldb.eBasicTypeLongDoubleComplex: (True, True, False),
-    lldb.eBasicTypeObjCID: (False, False, False),
-    lldb.eBasicTypeObjCClass: (False, False, False),
-    lldb.eBasicTypeObjCSel: (False, False, False),
-    lldb.eBasicTypeNullPtr: (False, False, False),
-}
@@ -14,13 +14,7 @@ def show():
     debugger.display_html(document, position=2)
 
 def plot_image(image, xdim, ydim, cmap='nipy_spectral_r'):
-    image = debugger.unwrap(image)
-    if image.TypeIsPointerType():
-        image_addr = image.GetValueAsUnsigned()
-    else:
-        image_addr = image.AddressOf().GetValueAsUnsigned()
-    data = lldb.process.ReadMemory(image_addr, int(xdim * ydim) * 4, lldb.SBError())
-    data = np.frombuffer(data, dtype=np.int32).reshape((ydim,xdim))
+    data = debugger.to_array(image, (int(ydim), int(xdim)), np.int32)
     plt.imshow(data, cmap=cmap, interpolation='nearest')
     show()
 
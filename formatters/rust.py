@@ -1,8 +1,16 @@
 import sys
 import logging
 import re
+import itertools
+import struct
+import time
 import lldb
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 if sys.version_info[0] == 2:
     # python2-based LLDB accepts utf8-encoded ascii strings only.
     to_lldb_str = lambda s: s.encode('utf8', 'backslashreplace') if isinstance(s, unicode) else s
@@ -27,40 +35,9 @@ def initialize_category(debugger):
     #attach_summary_to_type(get_array_summary, r'^.*\[[0-9]+\]$', True)
     attach_summary_to_type(get_tuple_summary, r'^\(.*\)$', True)
 
-    attach_synthetic_to_type(StrSliceSynthProvider, '&str')
-    attach_synthetic_to_type(StrSliceSynthProvider, 'str*')
-
-    attach_synthetic_to_type(StdStringSynthProvider, 'collections::string::String')
-    attach_synthetic_to_type(StdStringSynthProvider, 'alloc::string::String')
-
-    attach_synthetic_to_type(StdVectorSynthProvider, r'^collections::vec::Vec<.+>$', True)
-    attach_synthetic_to_type(StdVectorSynthProvider, r'^alloc::vec::Vec<.+>$', True)
-
-    attach_synthetic_to_type(SliceSynthProvider, r'^&(mut\s*)?\[.*\]$', True)
-    attach_synthetic_to_type(SliceSynthProvider, r'^slice<.+>.*$', True)
-
-    attach_synthetic_to_type(StdCStringSynthProvider, 'std::ffi::c_str::CString')
-    attach_synthetic_to_type(StdCStrSynthProvider, 'std::ffi::c_str::CStr')
-
-    attach_synthetic_to_type(StdOsStringSynthProvider, 'std::ffi::os_str::OsString')
-    attach_synthetic_to_type(StdOsStrSynthProvider, 'std::ffi::os_str::OsStr')
-
-    attach_synthetic_to_type(StdPathBufSynthProvider, 'std::path::PathBuf')
-    attach_synthetic_to_type(StdPathSynthProvider, 'std::path::Path')
-
-    attach_synthetic_to_type(StdRcSynthProvider, r'^alloc::rc::Rc<.+>$', True)
-    attach_synthetic_to_type(StdRcSynthProvider, r'^alloc::rc::Weak<.+>$', True)
-    attach_synthetic_to_type(StdArcSynthProvider, r'^alloc::(sync|arc)::Arc<.+>$', True)
-    attach_synthetic_to_type(StdArcSynthProvider, r'^alloc::(sync|arc)::Weak<.+>$', True)
-    attach_synthetic_to_type(StdMutexSynthProvider, r'^std::sync::mutex::Mutex<.+>$', True)
-
-    attach_synthetic_to_type(StdCellSynthProvider, r'^core::cell::Cell<.+>$', True)
-    attach_synthetic_to_type(StdRefCellSynthProvider, r'^core::cell::RefCell<.+>$', True)
-    attach_synthetic_to_type(StdRefCellBorrowSynthProvider, r'^core::cell::Ref<.+>$', True)
-    attach_synthetic_to_type(StdRefCellBorrowSynthProvider, r'^core::cell::RefMut<.+>$', True)
-
-    attach_synthetic_to_type(StdHashMapSynthProvider, r'^std::collections::hash::map::HashMap<.+>$', True)
-    attach_synthetic_to_type(StdHashSetSynthProvider, r'^std::collections::hash::set::HashSet<.+>$', True)
+    # Standard library types are handled by a single dispatching provider, so that LLDB has to match
+    # type names against just one regex.
+    attach_synthetic_to_type(StdTypeSynthProvider, std_types_regex(), True)
 
 # Enums and tuples cannot be recognized based on type name.
 # These require deeper runtime analysis to tease them apart.
@@ -113,10 +90,14 @@ def attach_summary_to_type(summary_fn, type_name, is_regex=False):
 # This trick allows us to share data extraction logic between synth providers and their
 # sibling summary providers.
 def get_synth_summary(synth_class, valobj, dict):
+    if is_disabled(valobj):
+        return None
+    start = time.time()
     synth = synth_class(valobj.GetNonSyntheticValue(), dict)
     synth.update()
     summary = synth.get_summary()
-    return to_lldb_str(summary)
+    check_time_budget(valobj, start)
+    return to_lldb_str(summary) if summary is not None else None
 
 # Chained GetChildMemberWithName lookups
 def gcm(valobj, *chain):
@@ -166,6 +147,122 @@ def sequence_summary(childern, maxsize=32):
             break
     return s
 
+# Rust integer types whose sequences can be summarized directly from memory: { type name : is_signed }
+int_type_signedness = {
+    'u8': False, 'u16': False, 'u32': False, 'u64': False, 'usize': False,
+    'i8': True, 'i16': True, 'i32': True, 'i64': True, 'isize': True,
+}
+int_struct_codes = { 1: 'b', 2: 'h', 4: 'i', 8: 'q' }
+SEQUENCE_SUMMARY_ITEMS = 32 # Enough items to always exceed sequence_summary's default maxsize.
+
+# Produces the same summary as sequence_summary() for sequences of integers, but from a single
+# memory read of the first few items.  Returns None if items are not integers or cannot be read.
+def int_sequence_summary(ptr, length, item_type, maxsize=32):
+    is_signed = int_type_signedness.get(item_type.GetCanonicalType().GetName())
+    item_size = item_type.GetByteSize()
+    code = int_struct_codes.get(item_size)
+    if is_signed is None or code is None:
+        return None
+    if not is_signed:
+        code = code.upper()
+    count = min(length, SEQUENCE_SUMMARY_ITEMS)
+    if count == 0:
+        return ''
+    process = ptr.GetProcess()
+    error = lldb.SBError()
+    data = process.ReadMemory(ptr.GetValueAsUnsigned(), count * item_size, error)
+    if not error.Success():
+        return None
+    byte_order = '<' if process.GetByteOrder() == lldb.eByteOrderLittle else '>'
+    s = ''
+    for item in struct.unpack('%s%d%s' % (byte_order, count, code), data):
+        if len(s) > 0: s += ', '
+        s += str(item)
+        if len(s) > maxsize:
+            s += ', ...'
+            break
+    return s
+
+# Caches values computed while the debuggee is stopped; entries are discarded once it has been resumed.
+# Unless `include_expression_stops` is False, entries are also discarded after an expression has been evaluated
+# in the debuggee, since that may have changed its memory.
+class PerStopCache(object):
+    def __init__(self, include_expression_stops=True):
+        self.include_expression_stops = include_expression_stops
+        self.stop_id = None
+        self.entries = {}
+
+    def get_entries(self, process):
+        stop_id = (process.GetUniqueID(), process.GetStopID(self.include_expression_stops))
+        if stop_id != self.stop_id:
+            self.entries.clear()
+            self.stop_id = stop_id
+        return self.entries
+
+sequence_summaries = PerStopCache() # { (address, length, item type name) : summary }
+provider_states = PerStopCache() # { (load address, type name, value name, provider class) : provider's state }
+provider_instance_attrs = set(['valobj', '_real_class']) # Provider attributes that are not shared
+
+# ----- Budgets -----
+# A provider that is too slow, or asked to deal with an implausibly large object (usually an uninitialized
+# or corrupted value), gets disabled for all values of its type till the next stop; such values are then
+# displayed without formatting.
+
+TIME_BUDGET = 0.25 # Max time in seconds to initialize a provider, compute a summary, or produce its children.
+SIZE_BUDGET = 256 * 1024**2 # Max size in bytes of data a provider may be asked to deal with.
+
+class OverBudget(Exception):
+    pass
+
+disabled_types = PerStopCache(include_expression_stops=False) # { type name : reason }
+budget_reports = [] # Messages about disabled types, not yet shown to the user
+
+# Returns messages about types disabled since the last call; the debug adapter shows them in the debug console.
+def pop_budget_reports():
+    reports = budget_reports[:]
+    del budget_reports[:]
+    return reports
+
+def is_disabled(valobj):
+    return valobj.GetTypeName() in disabled_types.get_entries(valobj.GetProcess())
+
+def disable_type(valobj, reason):
+    entries = disabled_types.get_entries(valobj.GetProcess())
+    type_name = valobj.GetTypeName()
+    if type_name not in entries:
+        message = 'Formatting of %s has been disabled till the next stop: %s' % (type_name, reason)
+        log.warning('%s', message)
+        budget_reports.append(message)
+        entries[type_name] = reason
+
+def check_time_budget(valobj, start):
+    elapsed = time.time() - start
+    if elapsed > TIME_BUDGET:
+        disable_type(valobj, 'took %.2fs' % elapsed)
+
+timed_provider_classes = {} # { provider class : its subclass that accounts for time spent producing children }
+
+# Returns a subclass of provider_class whose get_child_at_index() adds up the time spent in it, so that slow
+# child enumeration disables the type just like slow initialization does.
+def get_timed_provider_class(provider_class):
+    timed_class = timed_provider_classes.get(provider_class)
+    if timed_class is None:
+        def get_child_at_index(self, index):
+            start = time.time()
+            try:
+                return provider_class.get_child_at_index(self, index)
+            finally:
+                self.children_time = self.__dict__.get('children_time', 0) + time.time() - start
+                if self.children_time > TIME_BUDGET:
+                    disable_type(self.valobj, 'took %.2fs to produce children' % self.children_time)
+        timed_class = type(provider_class.__name__, (provider_class,), { 'get_child_at_index': get_child_at_index })
+        timed_provider_classes[provider_class] = timed_class
+    return timed_class
+
+def check_size_budget(size):
+    if size > SIZE_BUDGET:
+        raise OverBudget('%d bytes of data' % size)
+
 def get_unqualified_type_name(type_name):
     if type_name[0] in unqual_type_markers:
         return type_name
@@ -221,11 +318,35 @@ class RustSynthProvider(object):
 
     class Uninitialized(object):
         def __do_init(self, update=False):
-            self.__class__ = self._real_class
+            self.__class__ = get_timed_provider_class(self._real_class)
             try:
                 if not update:
                     log.warning('Synth provider method has been called before update()')
-                self.initialize()
+                valobj = self.valobj
+                if is_disabled(valobj):
+                    self.__class__ = RawSynthProvider
+                    return self
+                start = time.time()
+                # LLDB creates separate provider instances for the summary and for the children of the same
+                # value, so we make providers of the same in-memory object share the state computed by
+                # initialize() during a stop.  Each provider keeps its own valobj.
+                address = valobj.GetLoadAddress()
+                if address != lldb.LLDB_INVALID_ADDRESS:
+                    states = provider_states.get_entries(valobj.GetProcess())
+                    key = (address, valobj.GetType().GetName(), valobj.GetName(), self._real_class)
+                    state = states.get(key)
+                    if state is not None:
+                        self.__dict__.update(state)
+                    else:
+                        self.initialize()
+                        states[key] = dict((name, value) for name, value in self.__dict__.items()
+                                           if name not in provider_instance_attrs)
+                else:
+                    self.initialize()
+                check_time_budget(valobj, start)
+            except OverBudget as e:
+                disable_type(self.valobj, str(e))
+                self.__class__ = RawSynthProvider
             except Exception as e:
                 log.error('Error during RustSynthProvider initialization: %s', e)
                 self.__class__ = RustSynthProvider # This object is in a broken state, so fall back to default impls.
@@ -244,6 +365,20 @@ class RustSynthProvider(object):
             return self.__do_init().get_summary()
 
 
+# Exposes the raw structure of a value, used in place of disabled providers.
+class RawSynthProvider(RustSynthProvider):
+    def num_children(self):
+        return self.valobj.GetNumChildren()
+
+    def has_children(self):
+        return self.valobj.MightHaveChildren()
+
+    def get_child_at_index(self, index):
+        return self.valobj.GetChildAtIndex(index)
+
+    def get_child_index(self, name):
+        return self.valobj.GetIndexOfChildWithName(name)
+
 def make_encoded_enum_provider_class(variant_name):
     # 'Encoded' enums always have two variants, of which one contains no data,
     # and the other one contains a field (not necessarily at the top level) that implements
@@ -326,10 +461,11 @@ class ArrayLikeSynthProvider(RustSynthProvider):
         self.len = len
         self.item_type = self.ptr.GetType().GetPointeeType()
         self.item_size = self.item_type.GetByteSize()
+        check_size_budget(self.len * self.item_size)
         return True
 
     def ptr_and_len(self):
-        raise Error('ptr_and_len must be overridden')
+        raise NotImplementedError('ptr_and_len must be overridden')
 
     def num_children(self):
         return self.len
@@ -357,6 +493,17 @@ class ArrayLikeSynthProvider(RustSynthProvider):
     def get_summary(self):
         return '(%d)' % (self.len,)
 
+    def get_items_summary(self):
+        entries = sequence_summaries.get_entries(self.valobj.GetProcess())
+        key = (self.ptr.GetValueAsUnsigned(), self.len, self.item_type.GetName())
+        summary = entries.get(key)
+        if summary is None:
+            summary = int_sequence_summary(self.ptr, self.len, self.item_type)
+            if summary is None:
+                summary = sequence_summary((self.get_child_at_index(i) for i in xrange(self.len)))
+            entries[key] = summary
+        return summary
+
 class StdVectorSynthProvider(ArrayLikeSynthProvider):
     def ptr_and_len(self, vec):
         return (
@@ -365,7 +512,7 @@ class StdVectorSynthProvider(ArrayLikeSynthProvider):
         )
     def get_summary(self):
         try:
-            return '(%d) vec![%s]' % (self.len, sequence_summary((self.get_child_at_index(i) for i in xrange(self.len))))
+            return '(%d) vec![%s]' % (self.len, self.get_items_summary())
         except Exception as e:
             log.error('%s', e)
             raise
@@ -379,7 +526,7 @@ class SliceSynthProvider(ArrayLikeSynthProvider):
             gcm(vec, 'length').GetValueAsUnsigned()
         )
     def get_summary(self):
-        return '(%d) &[%s]' % (self.len, sequence_summary((self.get_child_at_index(i) for i in xrange(self.len))))
+        return '(%d) &[%s]' % (self.len, self.get_items_summary())
 
 # Base class for *String providers
 class StringLikeSynthProvider(ArrayLikeSynthProvider):
@@ -533,29 +680,64 @@ class StdRefCellBorrowSynthProvider(DerefSynthProvider):
 
 ##################################################################################################################
 
-def compute_valid_indices(ctrl):
+# Maps hashbrown control bytes to 1 for occupied buckets (top bit clear) and 0 for empty or deleted ones.
+ctrl_full_table = bytes(bytearray([1 if b & 0x80 == 0 else 0 for b in range(256)]))
+CTRL_CHUNK = 64 * 1024 # Number of control bytes scanned at a time.
+
+def read_ctrl_bytes(ctrl_ptr, start, count):
     error = lldb.SBError()
-    valid_indices = []
-    for i in range(ctrl.GetByteSize()):
-        c = ctrl.GetUnsignedInt8(error, i)
-        if c & 0x80 == 0:
-            valid_indices.append(i)
-    return valid_indices
-
-class StdHashMapSynthProvider(RustSynthProvider):
+    data = ctrl_ptr.GetProcess().ReadMemory(ctrl_ptr.GetValueAsUnsigned() + start, count, error)
+    if not error.Success():
+        log.error('ReadMemory error: %s', error.GetCString())
+        return None
+    return data
+
+# Returns indices of the occupied buckets, given a buffer of control bytes.
+def compute_valid_indices(ctrl_bytes, base_index=0):
+    if numpy is not None:
+        indices = numpy.flatnonzero(numpy.frombuffer(ctrl_bytes, numpy.uint8) < 0x80)
+        return (indices + base_index).tolist()
+    full = bytearray(ctrl_bytes).translate(ctrl_full_table)
+    return list(itertools.compress(xrange(base_index, base_index + len(full)), full))
+
+# Occupied buckets of a hash table located so far; shared by all providers of the table.
+class BucketScan(object):
+    def __init__(self):
+        self.valid_indices = []
+        self.scanned = 0 # Number of control bytes scanned so far
+
+# Base class for hashbrown-based collections.
+# Occupied buckets are located lazily, CTRL_CHUNK control bytes at a time, as children are requested.
+class HashTableSynthProvider(RustSynthProvider):
     def initialize(self):
-        table = gcm(self.valobj, 'base', 'table')
-        items = gcm(table, 'items').GetValueAsUnsigned()
+        table = self.get_table()
         self.num_buckets = gcm(table, 'bucket_mask').GetValueAsUnsigned() + 1
-
-        ctrl = gcm(table, 'ctrl', 'pointer').GetPointeeData(0, self.num_buckets)
-        self.valid_indices = compute_valid_indices(ctrl)
+        self.num_items = min(gcm(table, 'items').GetValueAsUnsigned(), self.num_buckets)
+        self.ctrl_ptr = gcm(table, 'ctrl', 'pointer')
+        self.scan = BucketScan()
 
         data = gcm(table, 'data', 'pointer')
+        check_size_budget(self.num_buckets * (1 + data.GetType().GetPointeeType().GetByteSize()))
         data_arr_ty = data.GetType().GetPointeeType().GetArrayType(self.num_buckets)
         self.data = data.Dereference().Cast(data_arr_ty)
         return None
 
+    def get_table(self):
+        raise NotImplementedError('get_table must be overridden')
+
+    def get_bucket(self, index):
+        scan = self.scan
+        while index >= len(scan.valid_indices) and scan.scanned < self.num_buckets:
+            count = min(CTRL_CHUNK, self.num_buckets - scan.scanned)
+            ctrl_bytes = read_ctrl_bytes(self.ctrl_ptr, scan.scanned, count)
+            if ctrl_bytes is None:
+                break
+            scan.valid_indices.extend(compute_valid_indices(ctrl_bytes, scan.scanned))
+            scan.scanned += count
+        if index >= len(scan.valid_indices):
+            return None
+        return self.data.GetChildAtIndex(scan.valid_indices[index])
+
     def update(self):
         return True
 
@@ -563,54 +745,405 @@ class StdHashMapSynthProvider(RustSynthProvider):
         return True
 
     def num_children(self):
-        return len(self.valid_indices)
+        return self.num_items
 
     def get_child_at_index(self, index):
-        return self.data.GetChildAtIndex(self.valid_indices[index])
+        return self.get_bucket(index)
 
     def get_child_index(self, name):
         return None
 
     def get_summary(self):
-        return 'size=%d, capacity=%d' % (self.num_children(), self.num_buckets)
-
-
-class StdHashSetSynthProvider(RustSynthProvider):
-    def initialize(self):
-        table = gcm(self.valobj, 'map', 'base', 'table')
-        items = gcm(table, 'items').GetValueAsUnsigned()
-        self.num_buckets = gcm(table, 'bucket_mask').GetValueAsUnsigned() + 1
+        return 'size=%d, capacity=%d' % (self.num_items, self.num_buckets)
 
-        ctrl = gcm(table, 'ctrl', 'pointer').GetPointeeData(0, self.num_buckets)
-        self.valid_indices = compute_valid_indices(ctrl)
+class StdHashMapSynthProvider(HashTableSynthProvider):
+    def get_table(self):
+        return gcm(self.valobj, 'base', 'table')
 
-        data = gcm(table, 'data', 'pointer')
-        data_arr_ty = data.GetType().GetPointeeType().GetArrayType(self.num_buckets)
-        self.data = data.Dereference().Cast(data_arr_ty)
-        return None
-
-    def update(self):
-        return True
-
-    def has_children(self):
-        return True
-
-    def num_children(self):
-        return len(self.valid_indices)
+class StdHashSetSynthProvider(HashTableSynthProvider):
+    def get_table(self):
+        return gcm(self.valobj, 'map', 'base', 'table')
 
     def get_child_at_index(self, index):
-        child = self.data.GetChildAtIndex(self.valid_indices[index])
+        child = self.get_bucket(index)
+        if child is None:
+            return None
         # child is a tuple (K, ()).  We want return just the K, while keeping name of the parent tuple.
         name = child.GetName()
         child = child.GetChildAtIndex(0)
         return child.CreateChildAtOffset(name, 0, child.GetType())
 
-    def get_child_index(self, name):
-        return None
-
-    def get_summary(self):
-        return 'size=%d, capacity=%d' % (self.num_children(), self.num_buckets)
+##################################################################################################################
 
+# Providers for standard library types, selected by type name: (prefix, suffix, provider class).
+# A type name matches if it starts with the prefix and ends with the suffix; if suffix is None,
+# the prefix must match the whole name.
+std_type_providers = [
+    ('&str', None, StrSliceSynthProvider),
+    ('str*', None, StrSliceSynthProvider),
+
+    ('collections::string::String', None, StdStringSynthProvider),
+    ('alloc::string::String', None, StdStringSynthProvider),
+
+    ('collections::vec::Vec<', '>', StdVectorSynthProvider),
+    ('alloc::vec::Vec<', '>', StdVectorSynthProvider),
+
+    ('&[', ']', SliceSynthProvider),
+    ('&mut [', ']', SliceSynthProvider),
+    ('slice<', '', SliceSynthProvider),
+
+    ('std::ffi::c_str::CString', None, StdCStringSynthProvider),
+    ('std::ffi::c_str::CStr', None, StdCStrSynthProvider),
+
+    ('std::ffi::os_str::OsString', None, StdOsStringSynthProvider),
+    ('std::ffi::os_str::OsStr', None, StdOsStrSynthProvider),
+
+    ('std::path::PathBuf', None, StdPathBufSynthProvider),
+    ('std::path::Path', None, StdPathSynthProvider),
+
+    ('alloc::rc::Rc<', '>', StdRcSynthProvider),
+    ('alloc::rc::Weak<', '>', StdRcSynthProvider),
+    ('alloc::sync::Arc<', '>', StdArcSynthProvider),
+    ('alloc::arc::Arc<', '>', StdArcSynthProvider),
+    ('alloc::sync::Weak<', '>', StdArcSynthProvider),
+    ('alloc::arc::Weak<', '>', StdArcSynthProvider),
+    ('std::sync::mutex::Mutex<', '>', StdMutexSynthProvider),
+
+    ('core::cell::Cell<', '>', StdCellSynthProvider),
+    ('core::cell::RefCell<', '>', StdRefCellSynthProvider),
+    ('core::cell::Ref<', '>', StdRefCellBorrowSynthProvider),
+    ('core::cell::RefMut<', '>', StdRefCellBorrowSynthProvider),
+
+    ('std::collections::hash::map::HashMap<', '>', StdHashMapSynthProvider),
+    ('std::collections::hash::set::HashSet<', '>', StdHashSetSynthProvider),
+]
+
+# Escapes regex metacharacters in a way that is understood by both Python and LLDB (POSIX extended) regexes.
+def regex_escape(s):
+    return re.sub(r'([.^$*+?()\[\]{}|\\])', r'\\\1', s)
+
+# Returns a regex matching names of all types in std_type_providers.
+# Entries with a suffix match at least one character between the prefix and the suffix.
+def std_types_regex():
+    prefixes = set(prefix for prefix, suffix, provider in std_type_providers)
+    alternatives = []
+    for prefix, suffix, provider in std_type_providers:
+        if prefix.startswith('&mut '):
+            if '&' + prefix[5:] in prefixes:
+                continue # Matched together with the shared reference
+            pattern = r'&mut\s*' + regex_escape(prefix[5:])
+        elif prefix.startswith('&') and '&mut ' + prefix[1:] in prefixes:
+            pattern = r'&(mut\s*)?' + regex_escape(prefix[1:])
+        else:
+            pattern = regex_escape(prefix)
+        if suffix is not None:
+            pattern += '.+' + regex_escape(suffix)
+        alternatives.append(pattern)
+    return '^(' + '|'.join(alternatives) + ')$'
+
+# Classifies type names by walking a trie of prefixes from std_type_providers.
+# Results are memoized, since the same generic instantiations are seen over and over again.
+class TypeNameClassifier(object):
+    def __init__(self, entries):
+        self.trie = {} # { character : node }; entries ending at a node are stored under the None key.
+        self.cache = {} # { type name : provider class or None }
+        for prefix, suffix, provider in entries:
+            node = self.trie
+            for c in prefix:
+                node = node.setdefault(c, {})
+            node.setdefault(None, []).append((len(prefix), suffix, provider))
+
+    def classify(self, type_name):
+        try:
+            return self.cache[type_name]
+        except KeyError:
+            pass
+        result = None
+        node = self.trie
+        for i in xrange(len(type_name) + 1):
+            for prefix_len, suffix, provider in node.get(None, ()):
+                if suffix is None:
+                    if prefix_len == len(type_name):
+                        result = provider
+                elif type_name.endswith(suffix) and len(type_name) > prefix_len + len(suffix):
+                    result = provider # Longer prefixes take precedence
+            if i == len(type_name):
+                break
+            node = node.get(type_name[i])
+            if node is None:
+                break
+        self.cache[type_name] = result
+        return result
+
+std_type_classifier = TypeNameClassifier(std_type_providers)
+
+def classify_std_type(sbtype):
+    provider = classify_std_type_name(sbtype)
+    # LLDB also applies the provider to pointers and references to the matching types.
+    if provider is None and sbtype.GetTypeClass() in [lldb.eTypeClassPointer, lldb.eTypeClassReference]:
+        provider = classify_std_type_name(sbtype.GetPointeeType())
+    return provider
+
+def classify_std_type_name(sbtype):
+    name = sbtype.GetName()
+    if name.startswith('&mut'):
+        name = re.sub(r'^&mut\s*', '&mut ', name)
+    provider = std_type_classifier.classify(name)
+    if provider is None: # Matched via a typedef
+        provider = std_type_classifier.classify(sbtype.GetCanonicalType().GetName())
+    return provider
+
+# Synthetic provider registered for all standard library types; behaves as the provider chosen
+# by classify_std_type().
+class StdTypeSynthProvider(RustSynthProvider):
+    def __init__(self, valobj, dict={}):
+        RustSynthProvider.__init__(self, valobj, dict)
+        self._real_class = classify_std_type(valobj.GetType()) or RustSynthProvider
+
+# --- Tests ---
+
+class TestType(object):
+    def __init__(self, name, type_class=lldb.eTypeClassStruct, pointee=None, canonical=None):
+        self.name = name
+        self.type_class = type_class
+        self.pointee = pointee
+        self.canonical = canonical
+    def GetName(self): return self.name
+    def GetTypeClass(self): return self.type_class
+    def GetPointeeType(self): return self.pointee
+    def GetCanonicalType(self): return self.canonical or self
+
+def test_classify_std_type():
+    vec = TestType('alloc::vec::Vec<i32>')
+    assert classify_std_type(vec) is StdVectorSynthProvider
+    assert classify_std_type(TestType('&alloc::vec::Vec<i32>', lldb.eTypeClassPointer, vec)) is StdVectorSynthProvider
+    assert classify_std_type(TestType('alloc::vec::Vec<i32> &', lldb.eTypeClassReference, vec)) is StdVectorSynthProvider
+    assert classify_std_type(TestType('MyVec', lldb.eTypeClassTypedef, canonical=vec)) is StdVectorSynthProvider
+    assert classify_std_type(TestType('&mut  [u8]')) is SliceSynthProvider
+    assert classify_std_type(TestType('&mut[u8]')) is SliceSynthProvider
+    assert classify_std_type(TestType('&str')) is StrSliceSynthProvider
+    assert classify_std_type(TestType('alloc::vec::Vec<>')) is None
+    assert classify_std_type(TestType('&i32', lldb.eTypeClassPointer, TestType('i32', lldb.eTypeClassBuiltin))) is None
+
+def test_std_types_regex():
+    regex = re.compile(std_types_regex())
+    for name in ['alloc::vec::Vec<i32>', '&[u8]', '&mut [u8]', '&mut  [u8]', '&mut[u8]', '&str', 'alloc::string::String']:
+        assert regex.match(name), name
+    for name in ['alloc::vec::Vec<>', 'alloc::string::String2', '&alloc::vec::Vec<i32>', '&mut str']:
+        assert not regex.match(name), name
+
+class TestProcess(object):
+    stop_id = 1
+    expression_id = 1
+    def GetUniqueID(self): return 1
+    def GetStopID(self, include_expression_stops):
+        return self.expression_id if include_expression_stops else self.stop_id
+
+class TestValue(object):
+    def __init__(self, type_name, process=None):
+        self.type_name = type_name
+        self.process = process or TestProcess()
+    def GetTypeName(self): return self.type_name
+    def GetProcess(self): return self.process
+    def GetLoadAddress(self): return lldb.LLDB_INVALID_ADDRESS
+
+def test_disabled_types():
+    value = TestValue('test::Slow')
+    pop_budget_reports()
+    disable_type(value, 'test')
+    disable_type(value, 'test') # Reported once
+    assert pop_budget_reports() == ['Formatting of test::Slow has been disabled till the next stop: test']
+    assert pop_budget_reports() == []
+    value.process.expression_id += 1 # Evaluating an expression does not re-enable the type.
+    assert is_disabled(value)
+    value.process.stop_id += 1
+    assert not is_disabled(value)
+
+def test_children_time_budget():
+    global TIME_BUDGET
+    class Provider(RustSynthProvider):
+        def initialize(self):
+            self.items = ['a', 'b', 'c']
+        def num_children(self):
+            return len(self.items)
+        def get_child_at_index(self, index):
+            time.sleep(0.01)
+            return self.items[index]
+    value = TestValue('test::SlowChildren')
+    provider = Provider(value)
+    saved_budget = TIME_BUDGET
+    TIME_BUDGET = 0.015
+    try:
+        provider.update()
+        assert provider.get_child_at_index(0) == 'a'
+        assert not is_disabled(value)
+        assert provider.get_child_at_index(1) == 'b'
+        assert is_disabled(value)
+        assert len(pop_budget_reports()) == 1
+        # New providers for the type show the raw structure.
+        provider = Provider(value)
+        provider.update()
+        assert type(provider) is RawSynthProvider
+    finally:
+        TIME_BUDGET = saved_budget
+
+def test_int_sequence_summary():
+    process = lldb.SBProcess()
+    def make_pointer(item_type, data):
+        return lldb.create_value(process, 'p', item_type.GetPointerType(), struct.pack('<Q', process.alloc(data)))
+    int_types = [
+        ('i8', 1, lldb.eBasicTypeSignedChar), ('u8', 1, lldb.eBasicTypeUnsignedChar),
+        ('i16', 2, lldb.eBasicTypeShort), ('u16', 2, lldb.eBasicTypeUnsignedShort),
+        ('i32', 4, lldb.eBasicTypeInt), ('u32', 4, lldb.eBasicTypeUnsignedInt),
+        ('i64', 8, lldb.eBasicTypeLongLong), ('u64', 8, lldb.eBasicTypeUnsignedLongLong),
+        ('isize', 8, lldb.eBasicTypeLongLong), ('usize', 8, lldb.eBasicTypeUnsignedLongLong),
+    ]
+    for name, size, basic_type in int_types:
+        item_type = lldb.basic_type(name, size, basic_type)
+        values = [i * 37 % 128 for i in range(100)]
+        if name[0] == 'i':
+            values = [-v if i % 2 else v for i, v in enumerate(values)]
+            values[0] = -2**(size * 8 - 1)
+        else:
+            values[0] = 2**(size * 8) - 1
+        ptr = make_pointer(item_type, b''.join(lldb.pack_value(item_type, v) for v in values))
+        # Matches sequence_summary() over the items, including truncation of long sequences.
+        for length in [0, 1, 3, 100]:
+            items = [ptr.GetValueForExpressionPath('[%d]' % i) for i in range(length)]
+            expected = sequence_summary(items)
+            assert int_sequence_summary(ptr, length, item_type) == expected, (name, length)
+        assert int_sequence_summary(ptr, 100, item_type).endswith(', ...')
+        assert int_sequence_summary(ptr, 3, item_type, maxsize=2).endswith(', ...')
+    # Items that are not integers.
+    for item_type in [lldb.basic_type('f64', 8, lldb.eBasicTypeDouble), lldb.basic_type('bool', 1, lldb.eBasicTypeBool),
+                      lldb.basic_type('char', 4, lldb.eBasicTypeChar32), lldb.SBType.struct('S', [])]:
+        assert int_sequence_summary(make_pointer(item_type, b'\0' * 8), 1, item_type) is None
+    # Unreadable memory
+    u32 = lldb.basic_type('u32', 4, lldb.eBasicTypeUnsignedInt)
+    ptr = lldb.create_value(process, 'p', u32.GetPointerType(), struct.pack('<Q', 8))
+    assert int_sequence_summary(ptr, 3, u32) is None
+
+def test_compute_valid_indices():
+    global numpy
+    saved_numpy = numpy
+    try:
+        for numpy in set([saved_numpy, None]): # With and without numpy
+            assert compute_valid_indices(b'\x00\x7f\x80\xff\x01') == [0, 1, 4]
+            assert compute_valid_indices(b'\x00\x7f\x80\xff\x01', 8) == [8, 9, 12]
+            assert compute_valid_indices(b'\xff\x80') == []
+            assert compute_valid_indices(b'') == []
+    finally:
+        numpy = saved_numpy
+
+# Creates a HashMap whose buckets hold their index * 10.
+def make_test_hash_map(process, ctrl, num_items):
+    u64_type = lldb.basic_type('u64', 8, lldb.eBasicTypeUnsignedLongLong)
+    num_buckets = len(ctrl)
+    ctrl_address = process.alloc(bytes(bytearray(ctrl)))
+    data_address = process.alloc(struct.pack('<%dQ' % num_buckets, *[i * 10 for i in range(num_buckets)]))
+    def non_null(type):
+        return lldb.SBType.struct('core::ptr::NonNull<%s>' % type.GetName(), [('pointer', type.GetPointerType())])
+    table_type = lldb.SBType.struct('hashbrown::raw::RawTable<u64>', [
+        ('bucket_mask', u64_type), ('ctrl', non_null(lldb.basic_type('u8', 1, lldb.eBasicTypeUnsignedChar))),
+        ('data', non_null(u64_type)), ('items', u64_type)])
+    base_type = lldb.SBType.struct('hashbrown::map::HashMap<u64>', [('table', table_type)])
+    map_type = lldb.SBType.struct('std::collections::hash::map::HashMap<u64>', [('base', base_type)])
+    table = lldb.pack_struct(table_type, {
+        'bucket_mask': struct.pack('<Q', num_buckets - 1),
+        'ctrl': struct.pack('<Q', ctrl_address),
+        'data': struct.pack('<Q', data_address),
+        'items': struct.pack('<Q', num_items)})
+    return lldb.create_value(process, 'map', map_type, table)
+
+def test_hash_table():
+    global CTRL_CHUNK
+    EMPTY, DELETED, FULL = 0xFF, 0x80, 0x11
+    process = lldb.SBProcess()
+    provider_states.get_entries(process).clear() # Mock processes of other tests have the same ids.
+    saved_chunk = CTRL_CHUNK
+    CTRL_CHUNK = 4
+    try:
+        # Occupied buckets on both sides of chunk boundaries, and a chunk with none.
+        occupied = [0, 3, 4, 7, 12, 15]
+        ctrl = [FULL if i in occupied else EMPTY for i in range(16)]
+        ctrl[9] = DELETED
+        provider = StdHashMapSynthProvider(make_test_hash_map(process, ctrl, len(occupied)))
+        provider.update()
+        assert provider.num_children() == len(occupied)
+        assert provider.get_child_at_index(1).GetValueAsUnsigned() == 30
+        assert provider.scan.scanned == 4 # Only the first chunk has been scanned so far.
+        values = [provider.get_child_at_index(i).GetValueAsUnsigned() for i in range(len(occupied))]
+        assert values == [i * 10 for i in occupied]
+        assert provider.get_child_at_index(len(occupied)) is None
+        assert provider.get_summary() == 'size=6, capacity=16'
+
+        provider = StdHashMapSynthProvider(make_test_hash_map(process, [EMPTY] * 8, 0))
+        provider.update()
+        assert provider.num_children() == 0
+        assert provider.get_child_at_index(0) is None
+        assert provider.scan.scanned == 8
+        assert provider.get_summary() == 'size=0, capacity=8'
+
+        # `items` smaller than the number of occupied buckets: only that many children are produced and
+        # scanning stops as soon as they have been located.
+        provider = StdHashMapSynthProvider(make_test_hash_map(process, [FULL] * 16, 2))
+        provider.update()
+        assert provider.num_children() == 2
+        assert [provider.get_child_at_index(i).GetValueAsUnsigned() for i in range(2)] == [0, 10]
+        assert provider.scan.scanned == 4
+    finally:
+        CTRL_CHUNK = saved_chunk
+
+def test_per_stop_cache():
+    process = TestProcess()
+    cache = PerStopCache()
+    memory_cache = PerStopCache(include_expression_stops=False)
+    cache.get_entries(process)['a'] = 1
+    memory_cache.get_entries(process)['a'] = 1
+    assert cache.get_entries(process) == { 'a': 1 }
+    process.expression_id += 1
+    assert cache.get_entries(process) == {}
+    assert memory_cache.get_entries(process) == { 'a': 1 }
+    process.stop_id += 1
+    assert memory_cache.get_entries(process) == {}
+
+def test_provider_states():
+    process = lldb.SBProcess()
+    provider_states.get_entries(process).clear() # Mock processes of other tests have the same ids.
+    value = make_test_hash_map(process, [0x11, 0xFF, 0x11, 0xFF], 2)
+    provider = StdHashMapSynthProvider(value)
+    provider.update()
+    assert provider.get_child_at_index(1).GetValueAsUnsigned() == 20
+    # Another provider of the same value, e.g. the one producing its summary, reuses the computed state,
+    # including buckets located so far, but keeps its own valobj.
+    other_value = lldb.SBValue(process, value.GetType(), value.GetLoadAddress(), 'map')
+    lldb.reset_sb_calls()
+    other = StdHashMapSynthProvider(other_value)
+    other.update()
+    assert other.valobj is other_value and provider.valobj is value
+    assert other.scan is provider.scan
+    assert other.get_child_at_index(1).GetValueAsUnsigned() == 20
+    assert lldb.sb_calls['SBProcess.ReadMemory'] == 0
+    # Values at the same address, but with a different name, or after the debuggee has been resumed,
+    # are initialized anew.
+    other = StdHashMapSynthProvider(lldb.SBValue(process, value.GetType(), value.GetLoadAddress(), 'alias'))
+    other.update()
+    assert other.scan is not provider.scan
+    process.resume()
+    other = StdHashMapSynthProvider(value)
+    other.update()
+    assert other.scan is not provider.scan
+
+def run_tests():
+    test_classify_std_type()
+    test_std_types_regex()
+    test_disabled_types()
+    test_children_time_budget()
+    test_int_sequence_summary()
+    test_compute_valid_indices()
+    test_hash_table()
+    test_per_stop_cache()
+    test_provider_states()
 
 ##################################################################################################################
 
@@ -0,0 +1,71 @@
+#!/usr/bin/python
+# Simulates a long instruction-stepping session through code without debug info,
+# which creates many small disassembled ranges, and measures the cost of address lookups and inserts.
+from __future__ import print_function
+import sys
+import time
+import random
+import set_lldb_path
+from adapter.disassembly import IntervalIndex
+
+INSTRUCTIONS_PER_RANGE = 32
+INSTRUCTION_SIZE = 4
+
+class FakeRange:
+    def __init__(self, start_address, end_address):
+        self.start_address = start_address
+        self.end_address = end_address
+
+# The list-based index AddressSpace used to have, for comparison.
+class ListIndex:
+    def __init__(self):
+        self.items = []
+
+    def __len__(self):
+        return len(self.items)
+
+    def insert(self, item):
+        a = self.items
+        lo, hi = 0, len(a)
+        while lo < hi:
+            mid = (lo+hi)//2
+            if a[mid].start_address < item.start_address: lo = mid+1
+            else: hi = mid
+        a.insert(lo, item)
+
+    def find(self, address):
+        a = self.items
+        lo, hi = 0, len(a)
+        while lo < hi:
+            mid = (lo+hi)//2
+            if address < a[mid].start_address: hi = mid
+            else: lo = mid+1
+        i = lo - 1
+        if i >= 0 and a[i].start_address <= address < a[i].end_address:
+            return a[i]
+        return None
+
+def simulate(index, num_steps, seed=0):
+    rng = random.Random(seed)
+    pc = 0x400000
+    for _ in range(num_steps):
+        # Mostly step to the next instruction, sometimes jump far away (a call or a return).
+        if rng.random() < 0.05:
+            pc = rng.randrange(0x400000, 0x40000000, INSTRUCTION_SIZE)
+        else:
+            pc += INSTRUCTION_SIZE
+        if index.find(pc) is None:
+            index.insert(FakeRange(pc, pc + INSTRUCTIONS_PER_RANGE * INSTRUCTION_SIZE))
+    return index
+
+def main():
+    num_steps = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    for cls in [ListIndex, IntervalIndex]:
+        start = time.time()
+        index = simulate(cls(), num_steps)
+        elapsed = time.time() - start
+        print('%-14s %d steps, %d ranges: %.3fs (%.2f us/step)' % (
+              cls.__name__, num_steps, len(index), elapsed, elapsed / num_steps * 1e6))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,178 @@
+#!/usr/bin/python
+# Measures the cost of Rust formatters and of expressions.Value against synthetic memory images,
+# using the mock `lldb` module in tools/mock_lldb, so no LLDB or debuggee is needed.
+# Reports wall time and the number of SB API calls per value; results are also checked for correctness.
+from __future__ import print_function
+import os
+import sys
+import time
+import random
+import struct
+
+tools_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(tools_dir, 'mock_lldb'))
+sys.path.insert(0, os.path.join(os.path.dirname(tools_dir), 'formatters'))
+sys.path.insert(0, os.path.dirname(tools_dir))
+import lldb
+import rust
+from adapter import expressions, from_lldb_str
+from adapter.debugsession import DebugSession
+
+if sys.version_info[0] == 2:
+    range = xrange
+
+usize = lldb.basic_type('usize', 8, lldb.eBasicTypeUnsignedLong)
+u8 = lldb.basic_type('u8', 1, lldb.eBasicTypeUnsignedChar)
+i32 = lldb.basic_type('i32', 4, lldb.eBasicTypeInt)
+u64 = lldb.basic_type('u64', 8, lldb.eBasicTypeUnsignedLong)
+f64 = lldb.basic_type('f64', 8, lldb.eBasicTypeDouble)
+
+def vec_type(item_type):
+    unique = lldb.SBType.struct('core::ptr::Unique<%s>' % item_type.name, [('pointer', item_type.GetPointerType())])
+    raw_vec = lldb.SBType.struct('alloc::raw_vec::RawVec<%s>' % item_type.name, [('ptr', unique), ('cap', usize)])
+    return lldb.SBType.struct('alloc::vec::Vec<%s>' % item_type.name, [('buf', raw_vec), ('len', usize)])
+
+def create_vec(process, vec_ty, item_type, items):
+    code = {'u8': 'B', 'i32': 'i', 'u64': 'Q', 'f64': 'd'}[item_type.name]
+    data_ptr = process.alloc(struct.pack('<%d%s' % (len(items), code), *items))
+    raw_vec = vec_ty.fields[0].type
+    unique = raw_vec.fields[0].type
+    data = lldb.pack_struct(vec_ty, {
+        'buf': lldb.pack_struct(raw_vec, {
+            'ptr': lldb.pack_struct(unique, { 'pointer': struct.pack('<Q', data_ptr) }),
+            'cap': struct.pack('<Q', len(items))
+        }),
+        'len': struct.pack('<Q', len(items))
+    })
+    return lldb.create_value(process, 'v', vec_ty, data)
+
+def hash_map_type(key_type, value_type):
+    tuple_ty = lldb.SBType.struct('(%s, %s)' % (key_type.name, value_type.name),
+                                  [('__0', key_type), ('__1', value_type)])
+    ctrl = lldb.SBType.struct('core::ptr::NonNull<u8>', [('pointer', u8.GetPointerType())])
+    data = lldb.SBType.struct('core::ptr::NonNull<%s>' % tuple_ty.name, [('pointer', tuple_ty.GetPointerType())])
+    table = lldb.SBType.struct('hashbrown::raw::RawTable<%s>' % tuple_ty.name,
+                               [('bucket_mask', usize), ('ctrl', ctrl), ('data', data), ('growth_left', usize),
+                                ('items', usize)])
+    base = lldb.SBType.struct('hashbrown::map::HashMap<%s, %s>' % (key_type.name, value_type.name),
+                              [('table', table)])
+    return lldb.SBType.struct('std::collections::hash::map::HashMap<%s, %s>' % (key_type.name, value_type.name),
+                              [('base', base)])
+
+def create_hash_map(process, map_ty, num_buckets, fill, rng):
+    base = map_ty.fields[0].type
+    table = base.fields[0].type
+    ctrl = bytearray(b'\xFF' * num_buckets)
+    entries = bytearray(num_buckets * 16)
+    items = 0
+    for i in range(num_buckets):
+        if rng.random() < fill:
+            ctrl[i] = rng.randrange(0x80)
+            entries[i*16 : i*16+16] = struct.pack('<QQ', i, i * 2)
+            items += 1
+    ctrl_ptr = process.alloc(bytes(ctrl))
+    data_ptr = process.alloc(bytes(entries))
+    data = lldb.pack_struct(map_ty, {
+        'base': lldb.pack_struct(base, {
+            'table': lldb.pack_struct(table, {
+                'bucket_mask': struct.pack('<Q', num_buckets - 1),
+                'ctrl': struct.pack('<Q', ctrl_ptr),
+                'data': struct.pack('<Q', data_ptr),
+                'items': struct.pack('<Q', items)
+            })
+        })
+    })
+    return lldb.create_value(process, 'm', map_ty, data), items
+
+def create_string(process, text):
+    string_ty = lldb.SBType.struct('alloc::string::String', [('vec', vec_type(u8))])
+    vec = create_vec(process, string_ty.fields[0].type, u8, bytearray(text.encode('utf8')))
+    return lldb.SBValue(process, string_ty, vec.address, 's')
+
+# Runs fn(value) for each value, in a new stop each time, and reports cost per value.
+def measure(label, process, values, fn, check=None):
+    lldb.reset_sb_calls()
+    start = time.time()
+    results = []
+    for value in values:
+        process.resume()
+        results.append(fn(value))
+    elapsed = time.time() - start
+    calls = lldb.total_sb_calls()
+    print('%-32s %6d values: %8.3fs %10.1f us/value %10.1f SB calls/value' % (
+          label, len(values), elapsed, elapsed / len(values) * 1e6, float(calls) / len(values)))
+    if check is not None:
+        for value, result in zip(values, results):
+            check(value, result)
+
+def expand(synth_class, valobj, num_children):
+    provider = synth_class(valobj, {})
+    provider.update()
+    return [provider.get_child_at_index(i) for i in range(min(num_children, provider.num_children()))]
+
+def main():
+    scale = float(sys.argv[1]) if len(sys.argv) > 1 else 1.0
+    rng = random.Random(0)
+    process = lldb.SBProcess()
+    summary = lambda synth_class: lambda v: rust.get_synth_summary(synth_class, v, {})
+
+    vec_i32 = vec_type(i32)
+    vecs = [create_vec(process, vec_i32, i32, [rng.randrange(-1000, 1000) for _ in range(rng.randrange(1, 2000))])
+            for _ in range(int(200 * scale))]
+    def check_vec_summary(v, result):
+        assert result.startswith('(%d) vec![' % v.GetChildMemberWithName('len').GetValueAsUnsigned()), result
+    measure('Vec<i32> summary', process, vecs, summary(rust.StdVectorSynthProvider), check_vec_summary)
+    measure('Vec<i32> 100 children', process, vecs, lambda v: expand(rust.StdVectorSynthProvider, v, 100))
+
+    vec_f64 = vec_type(f64)
+    fvecs = [create_vec(process, vec_f64, f64, [rng.random() for _ in range(100)]) for _ in range(int(200 * scale))]
+    measure('Vec<f64> summary', process, fvecs, summary(rust.StdVectorSynthProvider))
+
+    texts = [u'%d:%s' % (i, u'x\xe9' * rng.randrange(0, 2000)) for i in range(int(500 * scale))]
+    strings = [create_string(process, text) for text in texts]
+    expected = dict((s.address, t) for s, t in zip(strings, texts))
+    def check_string_summary(s, result):
+        text = expected[s.address]
+        result = from_lldb_str(result) # Summaries are UTF-8 encoded for LLDB on Python 2
+        assert result.startswith(u'"' + text[:100]), result[:100]
+    measure('String summary', process, strings, summary(rust.StdStringSynthProvider), check_string_summary)
+
+    map_ty = hash_map_type(u64, u64)
+    maps = [create_hash_map(process, map_ty, 1 << rng.randrange(4, 16), 0.5, rng) for _ in range(int(50 * scale))]
+    def check_map_summary(m, result):
+        assert result.startswith('size=%d,' % dict(maps)[m]), result
+    map_values = [m for m, items in maps]
+    measure('HashMap<u64,u64> summary', process, map_values, summary(rust.StdHashMapSynthProvider), check_map_summary)
+    def check_map_children(m, children):
+        for child in children:
+            key = child.GetChildMemberWithName('__0').GetValueAsUnsigned()
+            assert child.GetChildMemberWithName('__1').GetValueAsUnsigned() == key * 2
+    measure('HashMap<u64,u64> 100 children', process, map_values,
+            lambda m: expand(rust.StdHashMapSynthProvider, m, 100), check_map_children)
+
+    struct_ty = lldb.SBType.struct('Point', [('f%d' % i, i32) for i in range(20)])
+    structs = [lldb.create_value(process, 'p', struct_ty, struct.pack('<20i', *range(i, i + 20)))
+               for i in range(int(2000 * scale))]
+    session = DebugSession({}, None, None)
+    measure('get_container_summary', process, structs,
+            lambda v: session.get_container_summary(v, lldb.eFormatDefault))
+
+    array_ty = i32.GetArrayType(1000)
+    arrays = [lldb.create_value(process, 'a', array_ty, struct.pack('<1000i', *range(1000)))
+              for _ in range(int(20 * scale))]
+    def value_sum(a):
+        value = expressions.Value(a)
+        return sum(value[i] * 2 + 1 for i in range(len(value)))
+    def check_value_sum(a, result):
+        assert result == sum(i * 2 + 1 for i in range(1000)), result
+    measure('Value arithmetic (1000 items)', process, arrays, value_sum, check_value_sum)
+    def array_sum(a):
+        items = expressions.Value(a).to_array()
+        return sum(int(item) * 2 + 1 for item in items)
+    measure('to_array arithmetic (1000 items)', process, arrays, array_sum, check_value_sum)
+    def slice_sum(a):
+        return sum(item * 2 + 1 for item in expressions.Value(a)[0:1000])
+    measure('Value slice (1000 items)', process, arrays, slice_sum, check_value_sum)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,48 @@
+#!/usr/bin/python
+# Measures the formatter setup done before launch (DebugSession.pre_launch) for a program, with language-specific
+# formatters loaded on demand (the default) and eagerly.  Each mode runs in a fresh process, since LLDB keeps
+# imported formatter modules around.
+# Usage: bench_startup.py <program> [repeats]
+from __future__ import print_function
+import os
+import sys
+import time
+import subprocess
+import set_lldb_path
+import lldb
+from adapter import debugsession
+
+def measure(program, eager):
+    if eager:
+        debugsession.LANGUAGE_FORMATTERS = {}
+    debugger = lldb.SBDebugger.Create()
+    session = debugsession.DebugSession({}, None, lambda message: None)
+    session.debugger = debugger
+    start = time.time()
+    session.target = debugger.CreateTarget(program)
+    create_target = time.time() - start
+    start = time.time()
+    session.pre_launch()
+    pre_launch = time.time() - start
+    loaded = ','.join(sorted(os.path.basename(path) for path in session.loaded_formatters))
+    print('%.4f %.4f %s' % (create_target, pre_launch, loaded or '-'))
+
+def main():
+    if len(sys.argv) > 2 and sys.argv[1] == '--measure':
+        measure(sys.argv[2], sys.argv[3] == 'eager')
+        return
+    program = sys.argv[1]
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    for mode in ['lazy', 'eager']:
+        results = []
+        for _ in range(repeats):
+            output = subprocess.check_output([sys.executable, __file__, '--measure', program, mode])
+            create_target, pre_launch, loaded = output.decode('utf8').split()[-3:]
+            results.append((float(create_target), float(pre_launch)))
+        results.sort(key=lambda result: result[1])
+        create_target, pre_launch = results[len(results) // 2]
+        print('%-6s create target %.3fs, pre_launch %.3fs (median of %d), loaded: %s' % (
+              mode, create_target, pre_launch, repeats, loaded))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+#!/usr/bin/python
+# Measures the cost of matching type names against Rust formatter registrations, using many distinct
+# generic instantiations: the per-type regexes the formatters used to register, vs the single combined
+# regex and the prefix trie classifier of the type dispatcher.
+# All matching is done with Python's `re` module in this process; LLDB matches the registered regexes with
+# its own engine inside its type lookup, which this does not exercise.  The regex timings therefore only
+# compare the patterns against each other, while the trie timings are representative, since the dispatcher
+# runs the classifier in Python.
+from __future__ import print_function
+import os
+import re
+import sys
+import time
+import random
+import set_lldb_path
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'formatters'))
+import rust
+
+# Specifiers registered by initialize_category before the dispatcher was introduced: (pattern, is_regex).
+OLD_SPECIFIERS = [
+    ('&str', False), ('str*', False),
+    ('collections::string::String', False), ('alloc::string::String', False),
+    (r'^collections::vec::Vec<.+>$', True), (r'^alloc::vec::Vec<.+>$', True),
+    (r'^&(mut\s*)?\[.*\]$', True), (r'^slice<.+>.*$', True),
+    ('std::ffi::c_str::CString', False), ('std::ffi::c_str::CStr', False),
+    ('std::ffi::os_str::OsString', False), ('std::ffi::os_str::OsStr', False),
+    ('std::path::PathBuf', False), ('std::path::Path', False),
+    (r'^alloc::rc::Rc<.+>$', True), (r'^alloc::rc::Weak<.+>$', True),
+    (r'^alloc::(sync|arc)::Arc<.+>$', True), (r'^alloc::(sync|arc)::Weak<.+>$', True),
+    (r'^std::sync::mutex::Mutex<.+>$', True),
+    (r'^core::cell::Cell<.+>$', True), (r'^core::cell::RefCell<.+>$', True),
+    (r'^core::cell::Ref<.+>$', True), (r'^core::cell::RefMut<.+>$', True),
+    (r'^std::collections::hash::map::HashMap<.+>$', True),
+    (r'^std::collections::hash::set::HashSet<.+>$', True),
+]
+
+GENERICS = ['alloc::vec::Vec<%s>', 'std::collections::hash::map::HashMap<%s, %s>', 'alloc::rc::Rc<%s>',
+            'alloc::sync::Arc<%s>', 'core::cell::RefCell<%s>', '&[%s]', 'core::option::Option<%s>',
+            'my_crate::module::Wrapper<%s>']
+
+def make_type_names(count, seed=0):
+    rng = random.Random(seed)
+    names = set()
+    while len(names) < count:
+        leaf = 'my_crate::types::Type%d' % rng.randrange(count * 10)
+        for _ in range(rng.randrange(1, 4)):
+            generic = rng.choice(GENERICS)
+            leaf = generic % ((leaf,) * generic.count('%s'))
+        names.add(leaf)
+    return sorted(names)
+
+def match_old(regexes, names):
+    matched = 0
+    for name in names:
+        for pattern, regex in regexes:
+            if regex.match(name) if regex is not None else pattern == name:
+                matched += 1
+                break
+    return matched
+
+def match_combined(regex, names):
+    return sum(1 for name in names if regex.match(name))
+
+def match_trie(classifier, names):
+    return sum(1 for name in names if classifier.classify(name) is not None)
+
+def measure(label, fn, *args):
+    start = time.time()
+    matched = fn(*args)
+    elapsed = time.time() - start
+    print('%-22s %d matched: %.3fs (%.2f us/type)' % (label, matched, elapsed, elapsed / len(args[-1]) * 1e6))
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    names = make_type_names(count)
+    old_regexes = [(pattern, re.compile(pattern) if is_regex else None) for pattern, is_regex in OLD_SPECIFIERS]
+    combined = re.compile(rust.std_types_regex())
+    classifier = rust.TypeNameClassifier(rust.std_type_providers)
+    print('%d distinct type names' % len(names))
+    measure('per-type regexes', match_old, old_regexes, names)
+    measure('combined regex', match_combined, combined, names)
+    measure('trie, first lookup', match_trie, classifier, names)
+    measure('trie, memoized', match_trie, classifier, names)
+
+if __name__ == '__main__':
+    main()
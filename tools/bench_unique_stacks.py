@@ -0,0 +1,33 @@
+#!/usr/bin/python
+# Measures DEBUG_uniqueStacks on a large number of fake threads, using the mock `lldb` module in tools/mock_lldb.
+# This covers the adapter's own work (walking frames, grouping, sorting); with a real debuggee, LLDB's unwinding
+# of each thread comes on top of it.
+# Usage: bench_unique_stacks.py [num_threads] [num_frames] [num_distinct_stacks]
+from __future__ import print_function
+import os
+import sys
+import time
+import random
+
+tools_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(tools_dir, 'mock_lldb'))
+sys.path.insert(0, os.path.dirname(tools_dir))
+from adapter import debugsession
+from adapter.eventloop import EventLoop
+
+def main():
+    num_threads = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    num_frames = int(sys.argv[2]) if len(sys.argv) > 2 else 30
+    num_stacks = int(sys.argv[3]) if len(sys.argv) > 3 else 50
+    rng = random.Random(0)
+    distinct = [[rng.randrange(0x400000, 0x800000) for _ in range(num_frames)] for _ in range(num_stacks)]
+    session = debugsession.make_test_session(EventLoop(), [])
+    session.process = debugsession.make_test_threads([rng.choice(distinct) for _ in range(num_threads)])
+    session.DEBUG_stackTrace = lambda args: { 'stackFrames': [], 'totalFrames': 0 }
+    start = time.time()
+    stacks = session.DEBUG_uniqueStacks({})['stacks']
+    elapsed = time.time() - start
+    print('%d threads, %d frames each: %d unique stacks in %.3fs' % (num_threads, num_frames, len(stacks), elapsed))
+
+if __name__ == '__main__':
+    main()
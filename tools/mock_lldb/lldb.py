@@ -0,0 +1,490 @@
+# A stand-in for the `lldb` module, which allows running formatters and expression evaluation code against
+# synthetic memory images, without LLDB or a debuggee.
+# Only the parts of the SB API used by the adapter and formatters are implemented.  Calls to SB API
+# methods are counted in `sb_calls`.
+import struct
+import collections
+
+sb_calls = collections.Counter() # { 'SBClass.Method' : number of calls }
+
+def reset_sb_calls():
+    sb_calls.clear()
+
+def total_sb_calls():
+    return sum(sb_calls.values())
+
+# ----- Enumerations -----
+
+LLDB_INVALID_ADDRESS = 0xFFFFFFFFFFFFFFFF
+
+for _i, _name in enumerate(['Invalid', 'Void', 'Char', 'SignedChar', 'UnsignedChar', 'WChar', 'SignedWChar',
+        'UnsignedWChar', 'Char16', 'Char32', 'Short', 'UnsignedShort', 'Int', 'UnsignedInt', 'Long', 'UnsignedLong',
+        'LongLong', 'UnsignedLongLong', 'Int128', 'UnsignedInt128', 'Bool', 'Half', 'Float', 'Double', 'LongDouble',
+        'FloatComplex', 'DoubleComplex', 'LongDoubleComplex', 'ObjCID', 'ObjCClass', 'ObjCSel', 'NullPtr', 'Other']):
+    globals()['eBasicType' + _name] = _i
+
+for _i, _name in enumerate(['Default', 'Boolean', 'Binary', 'Bytes', 'BytesWithASCII', 'Char', 'CharPrintable',
+        'Complex', 'CString', 'Decimal', 'Enum', 'Hex', 'HexUppercase', 'Float', 'Octal', 'OSType', 'Unicode16',
+        'Unicode32', 'Unsigned', 'Pointer']):
+    globals()['eFormat' + _name] = _i
+
+eTypeClassInvalid = 0
+for _i, _name in enumerate(['Array', 'BlockPointer', 'Builtin', 'Class', 'ComplexFloat', 'ComplexInteger',
+        'Enumeration', 'Function', 'MemberPointer', 'ObjCObject', 'ObjCInterface', 'ObjCObjectPointer', 'Pointer',
+        'Reference', 'Struct', 'Typedef', 'Union', 'Vector', 'Other']):
+    globals()['eTypeClass' + _name] = 1 << _i
+eTypeClassAny = 0xFFFFFFFF
+
+eValueTypeInvalid = 0
+eValueTypeVariableGlobal = 1
+eValueTypeVariableStatic = 2
+eValueTypeVariableArgument = 3
+eValueTypeVariableLocal = 4
+eValueTypeRegister = 5
+eValueTypeRegisterSet = 6
+eValueTypeConstResult = 7
+
+eByteOrderLittle = 4
+eTypeOptionCascade = 1
+eLanguageTypeUnknown = 0
+eLanguageTypeC_plus_plus = 4
+eLanguageTypeC99 = 0xc
+eLanguageTypeRust = 0x1c
+
+# Integer struct codes by size, and float codes by basic type
+int_codes = { 1: 'b', 2: 'h', 4: 'i', 8: 'q' }
+float_codes = { eBasicTypeFloat: 'f', eBasicTypeDouble: 'd' }
+unsigned_basic_types = set([eBasicTypeBool, eBasicTypeChar, eBasicTypeUnsignedChar, eBasicTypeUnsignedWChar,
+    eBasicTypeChar16, eBasicTypeChar32, eBasicTypeUnsignedShort, eBasicTypeUnsignedInt, eBasicTypeUnsignedLong,
+    eBasicTypeUnsignedLongLong])
+
+# ----- SB API -----
+
+class SBError(object):
+    def __init__(self, message=None):
+        self.message = message
+
+    def Success(self):
+        return self.message is None
+
+    def Fail(self):
+        return self.message is not None
+
+    def GetCString(self):
+        return self.message
+
+    def SetErrorString(self, message):
+        self.message = message
+
+class SBTypeMember(object):
+    def __init__(self, name, type, offset):
+        self.name = name
+        self.type = type
+        self.offset = offset
+
+    def GetName(self):
+        return self.name
+
+    def GetType(self):
+        return self.type
+
+    def GetOffsetInBytes(self):
+        return self.offset
+
+class SBType(object):
+    def __init__(self, name, byte_size, type_class=eTypeClassBuiltin, basic_type=eBasicTypeInvalid,
+                 fields=(), pointee=None, element=None, count=0):
+        self.name = name
+        self.byte_size = byte_size
+        self.type_class = type_class
+        self.basic_type = basic_type
+        self.fields = list(fields) # [SBTypeMember]
+        self.pointee = pointee
+        self.element = element
+        self.count = count
+
+    @staticmethod
+    def struct(name, fields):
+        members = []
+        offset = 0
+        alignment = 1
+        for field_name, field_type in fields:
+            field_align = field_type.alignment()
+            offset = (offset + field_align - 1) // field_align * field_align
+            members.append(SBTypeMember(field_name, field_type, offset))
+            offset += field_type.byte_size
+            alignment = max(alignment, field_align)
+        size = (offset + alignment - 1) // alignment * alignment
+        return SBType(name, size, eTypeClassStruct, fields=members)
+
+    def alignment(self):
+        if self.type_class == eTypeClassStruct:
+            return max([m.type.alignment() for m in self.fields] or [1])
+        if self.type_class == eTypeClassArray:
+            return self.element.alignment()
+        return min(max(self.byte_size, 1), 8)
+
+    def IsValid(self):
+        return True
+
+    def GetName(self):
+        return self.name
+
+    def GetDisplayTypeName(self):
+        return self.name
+
+    def GetByteSize(self):
+        return self.byte_size
+
+    def GetTypeClass(self):
+        return self.type_class
+
+    def GetBasicType(self):
+        return self.basic_type
+
+    def GetCanonicalType(self):
+        return self
+
+    def IsPointerType(self):
+        return self.type_class == eTypeClassPointer
+
+    def GetPointerType(self):
+        return SBType(self.name + ' *', 8, eTypeClassPointer, pointee=self)
+
+    def GetPointeeType(self):
+        return self.pointee if self.pointee is not None else SBType('', 0, eTypeClassInvalid)
+
+    def GetArrayType(self, count):
+        return SBType('%s[%d]' % (self.name, count), self.byte_size * count, eTypeClassArray,
+                      element=self, count=count)
+
+    def GetArrayElementType(self):
+        return self.element if self.element is not None else SBType('', 0, eTypeClassInvalid)
+
+    def GetNumberOfFields(self):
+        return len(self.fields)
+
+    def GetFieldAtIndex(self, index):
+        return self.fields[index]
+
+# Memory image of the debuggee.  Memory is allocated in one contiguous block starting at `base`.
+class SBProcess(object):
+    def __init__(self, base=0x10000):
+        self.base = base
+        self.memory = bytearray()
+        self.stop_id = 1
+        self.target = SBTarget(self)
+
+    # Places data into memory and returns its address.
+    def alloc(self, data, align=16):
+        padding = -len(self.memory) % align
+        self.memory.extend(b'\0' * padding)
+        address = self.base + len(self.memory)
+        self.memory.extend(data)
+        return address
+
+    def read(self, address, size):
+        offset = address - self.base
+        if offset < 0 or offset + size > len(self.memory):
+            return None
+        return bytes(self.memory[offset : offset + size])
+
+    # Simulates resuming and stopping the debuggee.
+    def resume(self):
+        self.stop_id += 1
+
+    def IsValid(self):
+        return True
+
+    def GetTarget(self):
+        return self.target
+
+    def GetUniqueID(self):
+        return 1
+
+    def GetStopID(self, include_expression_stops=False):
+        return self.stop_id
+
+    def GetByteOrder(self):
+        return eByteOrderLittle
+
+    def GetAddressByteSize(self):
+        return 8
+
+    def ReadMemory(self, address, size, error):
+        data = self.read(address, size)
+        if data is None:
+            error.SetErrorString('memory read failed for 0x%x' % address)
+        return data
+
+    def WriteMemory(self, address, data, error):
+        offset = address - self.base
+        if offset < 0 or offset + len(data) > len(self.memory):
+            error.SetErrorString('memory write failed for 0x%x' % address)
+            return 0
+        self.memory[offset : offset + len(data)] = data
+        return len(data)
+
+    def ReadPointerFromMemory(self, address, error):
+        data = self.ReadMemory(address, 8, error)
+        return struct.unpack('<Q', data)[0] if data is not None else 0
+
+class SBTarget(object):
+    def __init__(self, process):
+        self.process = process
+
+    def IsValid(self):
+        return True
+
+    def GetProcess(self):
+        return self.process
+
+    def GetBasicType(self, basic_type):
+        return SBType('char', 1, basic_type=basic_type) if basic_type == eBasicTypeChar else \
+               SBType('', 0, basic_type=basic_type)
+
+class SBCompileUnit(object):
+    def GetLanguage(self):
+        return eLanguageTypeRust
+
+class SBFrame(object):
+    def GetCompileUnit(self):
+        return SBCompileUnit()
+
+class SBData(object):
+    def __init__(self, data):
+        self.data = data
+
+    def GetByteSize(self):
+        return len(self.data)
+
+    def GetUnsignedInt8(self, error, offset):
+        return bytearray(self.data[offset : offset + 1])[0]
+
+    def ReadRawData(self, error, offset, size):
+        return self.data[offset : offset + size]
+
+class SBValue(object):
+    def __init__(self, process=None, type=None, address=None, name=None):
+        self.process = process
+        self.type = type
+        self.address = address
+        self.name = name
+        self.format = eFormatDefault
+
+    def __nonzero__(self):
+        return self.IsValid()
+
+    __bool__ = __nonzero__
+
+    def data(self):
+        return self.process.read(self.address, self.type.byte_size)
+
+    def child(self, name, type, address):
+        return SBValue(self.process, type, address, name)
+
+    def deref_struct(self):
+        # Like LLDB, let pointers to structs expose the fields of their pointee.
+        if self.type.type_class == eTypeClassPointer and self.type.pointee.type_class == eTypeClassStruct:
+            return self.Dereference()
+        return self
+
+    def IsValid(self):
+        return self.type is not None
+
+    def IsSynthetic(self):
+        return False
+
+    def GetNonSyntheticValue(self):
+        return self
+
+    def SetFormat(self, format):
+        self.format = format
+
+    def GetName(self):
+        return self.name
+
+    def GetType(self):
+        return self.type if self.type is not None else SBType('', 0, eTypeClassInvalid)
+
+    def GetTypeName(self):
+        return self.GetType().GetName()
+
+    def GetProcess(self):
+        return self.process
+
+    def GetTarget(self):
+        return self.process.target
+
+    def GetFrame(self):
+        return SBFrame()
+
+    def GetLoadAddress(self):
+        return self.address if self.address is not None else LLDB_INVALID_ADDRESS
+
+    def GetValueAsUnsigned(self, fail_value=0):
+        if not self.IsValid() or self.type.byte_size not in int_codes:
+            return fail_value
+        data = self.data()
+        if data is None:
+            return fail_value
+        return struct.unpack('<' + int_codes[self.type.byte_size].upper(), data)[0]
+
+    def GetValueAsSigned(self, fail_value=0):
+        if not self.IsValid() or self.type.byte_size not in int_codes:
+            return fail_value
+        data = self.data()
+        if data is None:
+            return fail_value
+        return struct.unpack('<' + int_codes[self.type.byte_size], data)[0]
+
+    def GetValue(self):
+        if not self.IsValid():
+            return None
+        type_class = self.type.type_class
+        if type_class == eTypeClassPointer:
+            return '0x%016x' % self.GetValueAsUnsigned()
+        if type_class != eTypeClassBuiltin:
+            return None
+        basic_type = self.type.basic_type
+        if basic_type in float_codes:
+            return '%g' % struct.unpack('<' + float_codes[basic_type], self.data())[0]
+        if basic_type == eBasicTypeBool:
+            return 'true' if self.GetValueAsUnsigned() else 'false'
+        if self.format == eFormatHex:
+            return '0x%x' % self.GetValueAsUnsigned()
+        if basic_type in unsigned_basic_types:
+            return str(self.GetValueAsUnsigned())
+        return str(self.GetValueAsSigned())
+
+    def GetSummary(self):
+        return None
+
+    def GetNumChildren(self):
+        if not self.IsValid():
+            return 0
+        type_class = self.type.type_class
+        if type_class == eTypeClassStruct:
+            return len(self.type.fields)
+        if type_class == eTypeClassArray:
+            return self.type.count
+        if type_class == eTypeClassPointer:
+            pointee = self.type.pointee
+            return len(pointee.fields) if pointee.type_class == eTypeClassStruct else 1
+        return 0
+
+    def MightHaveChildren(self):
+        return self.GetNumChildren() > 0
+
+    def GetChildAtIndex(self, index):
+        if not self.IsValid():
+            return SBValue()
+        type_class = self.type.type_class
+        if type_class == eTypeClassStruct:
+            if 0 <= index < len(self.type.fields):
+                field = self.type.fields[index]
+                return self.child(field.name, field.type, self.address + field.offset)
+        elif type_class == eTypeClassArray:
+            if 0 <= index < self.type.count:
+                element = self.type.element
+                return self.child('[%d]' % index, element, self.address + index * element.byte_size)
+        elif type_class == eTypeClassPointer:
+            if self.type.pointee.type_class == eTypeClassStruct:
+                return self.Dereference().GetChildAtIndex(index)
+            elif index == 0:
+                return self.Dereference()
+        return SBValue()
+
+    def GetChildMemberWithName(self, name):
+        valobj = self.deref_struct()
+        if valobj.IsValid() and valobj.type.type_class == eTypeClassStruct:
+            for field in valobj.type.fields:
+                if field.name == name:
+                    return valobj.child(field.name, field.type, valobj.address + field.offset)
+        return SBValue()
+
+    def GetIndexOfChildWithName(self, name):
+        valobj = self.deref_struct()
+        if valobj.IsValid() and valobj.type.type_class == eTypeClassStruct:
+            for i, field in enumerate(valobj.type.fields):
+                if field.name == name:
+                    return i
+        return 0xFFFFFFFF
+
+    def GetValueForExpressionPath(self, path):
+        if path.startswith('[') and path.endswith(']'):
+            index = int(path[1:-1])
+            if self.type.type_class == eTypeClassArray:
+                return self.GetChildAtIndex(index)
+            if self.type.type_class == eTypeClassPointer:
+                pointee = self.type.pointee
+                return self.child(path, pointee, self.GetValueAsUnsigned() + index * pointee.byte_size)
+        return SBValue()
+
+    def Dereference(self):
+        if not self.IsValid() or self.type.type_class != eTypeClassPointer:
+            return SBValue()
+        return self.child('*' + (self.name or ''), self.type.pointee, self.GetValueAsUnsigned())
+
+    def Cast(self, type):
+        return self.child(self.name, type, self.address)
+
+    def CreateChildAtOffset(self, name, offset, type):
+        if self.type.type_class == eTypeClassPointer:
+            return self.child(name, type, self.GetValueAsUnsigned() + offset)
+        return self.child(name, type, self.address + offset)
+
+    def CreateValueFromAddress(self, name, address, type):
+        return self.child(name, type, address)
+
+    def GetPointeeData(self, item_idx=0, item_count=1):
+        pointee = self.type.pointee
+        start = self.GetValueAsUnsigned() + item_idx * pointee.byte_size
+        return SBData(self.process.read(start, item_count * pointee.byte_size))
+
+# ----- Call counting -----
+
+def count_calls(cls):
+    def make_counted(key, fn):
+        def counted(*args, **kwargs):
+            sb_calls[key] += 1
+            return fn(*args, **kwargs)
+        counted.__name__ = fn.__name__
+        return counted
+    for name, attr in list(vars(cls).items()):
+        if not name[0].isupper(): # SB API methods are CamelCase; helpers are not
+            continue
+        key = cls.__name__ + '.' + name
+        if isinstance(attr, staticmethod):
+            setattr(cls, name, staticmethod(make_counted(key, attr.__func__)))
+        elif callable(attr):
+            setattr(cls, name, make_counted(key, attr))
+
+for _cls in [SBError, SBTypeMember, SBType, SBProcess, SBTarget, SBCompileUnit, SBFrame, SBData, SBValue]:
+    count_calls(_cls)
+
+# ----- Helpers for building memory images -----
+
+def basic_type(name, size, basic_type):
+    return SBType(name, size, eTypeClassBuiltin, basic_type)
+
+def pack_value(type, value):
+    if type.basic_type in float_codes:
+        return struct.pack('<' + float_codes[type.basic_type], value)
+    code = int_codes[type.byte_size]
+    if type.type_class == eTypeClassPointer or type.basic_type in unsigned_basic_types:
+        code = code.upper()
+    return struct.pack('<' + code, value)
+
+# Packs a struct from a { field name : bytes } dictionary; missing fields are zero-filled.
+def pack_struct(type, fields):
+    data = bytearray(type.byte_size)
+    for member in type.fields:
+        field_data = fields.get(member.name)
+        if field_data is not None:
+            data[member.offset : member.offset + len(field_data)] = field_data
+    return bytes(data)
+
+# Places data into process memory and returns SBValue of the given type for it.
+def create_value(process, name, type, data):
+    return SBValue(process, type, process.alloc(data), name)
@@ -1,6 +1,20 @@
 #!/usr/bin/python
 # Execute tests in Python code
+import sys
 import set_lldb_path
-from adapter import expressions
+sys.path.append('formatters')
+import rust
+from adapter import arrays, expressions, sourcemap, disassembly, disasmcache, stringpages, memcache, memdump, eventloop, \
+                    debugsession
+arrays.run_tests()
 expressions.run_tests()
+disassembly.run_tests()
+disasmcache.run_tests()
+sourcemap.run_tests()
+stringpages.run_tests()
+memcache.run_tests()
+memdump.run_tests()
+eventloop.run_tests()
+debugsession.run_tests()
+rust.run_tests()
 print('Success')